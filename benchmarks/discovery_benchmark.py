@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Measure discovery engines against a simulated fleet of SSDP and GDM
+# devices on the loopback interface.
+#
+# The fleet runs in its own process and answers every M-SEARCH on behalf of
+# `--devices` devices, each from its own 127.0.0.x address, after
+# `--delay` plus up to `--jitter` seconds, dropping a `--loss` fraction of
+# the replies and padding them to `--size` bytes. Each engine then runs in
+# a fresh process, so that its CPU time and peak memory are its own:
+#
+#   python benchmarks/discovery_benchmark.py --devices 500 --loss 0.05
+#
+# Reported per engine (median of `--runs`):
+#
+#   found   devices found / devices expected
+#   ttfr    time to first result
+#   ttc     time until every expected device was found, '-' if never
+#   wall    time until the call returned
+#   rps     replies the fleet sent per second of wall time
+#   cpu     user + system CPU time of the engine process
+#   rss     peak resident memory of the engine process
+#
+# The blocking engines run on Python 2 and the asyncio ones on Python 3;
+# engines that cannot be imported by the running interpreter are skipped.
+
+import argparse
+import heapq
+import multiprocessing
+import os
+import random
+import re
+import resource
+import select
+import socket
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'service_discovery'))
+
+SSDP_GROUP = ('239.255.255.250', 1900)
+GDM_GROUP = ('239.0.0.250', 32414)
+INTERFACE = '127.0.0.1'
+SENDERS = 64  # source addresses the devices are spread over
+
+_st_re = re.compile(br'^ST:\s*(.*?)\s*$', re.I | re.M)
+
+
+def _pad(lines, size):
+    message = '\r\n'.join(lines) + '\r\n'
+    if len(message) + 14 < size:
+        message += 'X-Padding: %s\r\n' % ('x' * (size - len(message) - 14))
+    return (message + '\r\n').encode('latin-1')
+
+
+def ssdp_reply(i, st, size):
+    return _pad(['HTTP/1.1 200 OK',
+                 'CACHE-CONTROL: max-age=1800',
+                 'EXT:',
+                 'LOCATION: http://127.0.0.%d:49152/%d.xml' % (
+                     2 + i % SENDERS, i),
+                 'SERVER: Linux/3.4 UPnP/1.0 Simulated/1.0',
+                 'ST: %s' % st,
+                 'USN: uuid:00000000-0000-0000-0000-%012d::%s' % (i, st)],
+                size)
+
+
+def gdm_reply(i, size):
+    return _pad(['HTTP/1.0 200 OK',
+                 'Content-Type: plex/media-server',
+                 'Resource-Identifier: %040d' % i,
+                 'Name: simulated-%d' % i,
+                 'Port: 32400'],
+                size)
+
+
+def _listen(group):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    s.bind(('', group[1]))
+    try:
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                     socket.inet_aton(group[0]) + socket.inet_aton(INTERFACE))
+    except socket.error:
+        pass  # no multicast on loopback; searches still arrive unicast
+    return s
+
+
+def run_fleet(options, ready, sent):
+    listeners = [_listen(SSDP_GROUP), _listen(GDM_GROUP)]
+    senders = []
+    for i in range(SENDERS):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        s.bind(('127.0.0.%d' % (2 + i), 0))
+        senders.append(s)
+    rng = random.Random(options.seed)
+    pending = []  # (time, sequence, device, reply, addr)
+    sequence = 0
+    ready.set()
+    while True:
+        timeout = max(0, pending[0][0] - time.time()) if pending else None
+        readable, _, _ = select.select(listeners, [], [], timeout)
+        for s in readable:
+            data, addr = s.recvfrom(8192)
+            if not data.startswith(b'M-SEARCH'):
+                continue
+            m = _st_re.search(data)
+            now = time.time()
+            for i in range(options.devices):
+                if rng.random() < options.loss:
+                    continue
+                if s is listeners[0]:
+                    st = m.group(1).decode('latin-1') if m else \
+                        'upnp:rootdevice'
+                    reply = ssdp_reply(i, st, options.size)
+                else:
+                    reply = gdm_reply(i, options.size)
+                when = now + options.delay + rng.random() * options.jitter
+                heapq.heappush(pending, (when, sequence, i, reply, addr))
+                sequence += 1
+        now = time.time()
+        while pending and pending[0][0] <= now:
+            when, _, i, reply, addr = heapq.heappop(pending)
+            try:
+                senders[i % SENDERS].sendto(reply, addr)
+                sent.value += 1
+            except socket.error:
+                pass
+
+
+def _ssdp_iter(options):
+    import ssdpclient
+    return ssdpclient.iter_discover(INTERFACE, options.timeout,
+                                    retries=options.retries), 1
+
+
+def _ssdp_discover(options):
+    import ssdpclient
+    return iter([ssdpclient.discover(INTERFACE, options.timeout,
+                                     retries=options.retries)]), 1
+
+
+def _gdm_iter(options):
+    import gdmclient
+    return gdmclient.iter_discover(INTERFACE, options.timeout,
+                                   retries=options.retries), 1
+
+
+def _gdm_discover(options):
+    import gdmclient
+    return iter([gdmclient.discover(INTERFACE, options.timeout,
+                                    retries=options.retries)]), 1
+
+
+def _scan(options):
+    import engine
+    from protocols import GDM, SSDP
+    return engine.scan([SSDP(), GDM()], INTERFACE, options.timeout,
+                       retries=options.retries), 2
+
+
+def _aio(name):
+    def factory(options):
+        import asyncio
+        from service_discovery import aio
+
+        def results():
+            # drive the async generator one server at a time, so that the
+            # arrival of each one can be timed like for the other engines
+            loop = asyncio.new_event_loop()
+            servers = getattr(aio, name)(INTERFACE, options.timeout)
+            try:
+                while True:
+                    try:
+                        yield loop.run_until_complete(servers.__anext__())
+                    except StopAsyncIteration:
+                        return
+            finally:
+                loop.run_until_complete(servers.aclose())
+                loop.close()
+        return results(), 1
+    return factory
+
+
+ENGINES = [
+    ('ssdp-discover', _ssdp_discover),
+    ('ssdp-iter', _ssdp_iter),
+    ('gdm-discover', _gdm_discover),
+    ('gdm-iter', _gdm_iter),
+    ('scan', _scan),
+    ('aio-ssdp', _aio('ssdp_iter_discover')),
+    ('aio-gdm', _aio('gdm_iter_discover')),
+]
+
+
+def measure(factory, options, sent, results):
+    try:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.time()
+        sent_before = sent.value
+        items, per_device = factory(options)
+        expected = options.devices * per_device
+        found = 0
+        ttfr = ttc = None
+        for item in items:
+            elapsed = time.time() - start
+            # discover() returns all its servers at once, as a dict
+            found += len(item) if isinstance(item, dict) else 1
+            if ttfr is None:
+                ttfr = elapsed
+            if ttc is None and found >= expected:
+                ttc = elapsed
+        wall = time.time() - start
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = (after.ru_utime - usage.ru_utime +
+               after.ru_stime - usage.ru_stime)
+        # ru_maxrss is in kilobytes on Linux, in bytes on OS X
+        rss = after.ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+        results.put(dict(found=found, expected=expected, ttfr=ttfr, ttc=ttc,
+                         wall=wall, rps=(sent.value - sent_before) / wall,
+                         cpu=cpu, rss=rss))
+    except (ImportError, SyntaxError) as e:
+        results.put(dict(skipped=str(e)))
+
+
+def _median(values):
+    # a run that never got there counts as slower than any other
+    values = sorted(values, key=lambda v: (v is None, v))
+    return values[len(values) // 2]
+
+
+def _ms(value):
+    return '-' if value is None else '%.1f' % (value * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--devices', type=int, default=100)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--size', type=int, default=300)
+    parser.add_argument('--timeout', type=float, default=1.0)
+    parser.add_argument('--retries', type=int, default=0)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engines', default=','.join(n for n, f in ENGINES))
+    options = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    sent = multiprocessing.Value('L', 0)
+    fleet = multiprocessing.Process(target=run_fleet,
+                                    args=(options, ready, sent))
+    fleet.daemon = True
+    fleet.start()
+    ready.wait()
+
+    engines = dict(ENGINES)
+    print('%d devices, delay %gs + %gs jitter, %g%% loss, %d bytes' % (
+        options.devices, options.delay, options.jitter, options.loss * 100,
+        options.size))
+    print('%-14s %11s %9s %9s %9s %9s %9s %8s' % (
+        'engine', 'found', 'ttfr ms', 'ttc ms', 'wall ms', 'rps',
+        'cpu ms', 'rss KB'))
+    try:
+        for name in options.engines.split(','):
+            runs = []
+            for i in range(options.runs):
+                results = multiprocessing.Queue()
+                p = multiprocessing.Process(
+                    target=measure,
+                    args=(engines[name], options, sent, results))
+                p.start()
+                runs.append(results.get())
+                p.join()
+                if 'skipped' in runs[-1]:
+                    break
+            if 'skipped' in runs[-1]:
+                print('%-14s skipped: %s' % (name, runs[-1]['skipped']))
+                continue
+
+            def median(key):
+                return _median([run[key] for run in runs])
+            print('%-14s %5d/%-5d %9s %9s %9s %9d %9s %8d' % (
+                name, median('found'), runs[0]['expected'],
+                _ms(median('ttfr')), _ms(median('ttc')), _ms(median('wall')),
+                median('rps'), _ms(median('cpu')), median('rss')))
+    finally:
+        fleet.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compare headers.Headers with the email.message_from_string path that
+# discover() used to take for every datagram.
+#
+#   python benchmarks/headers_benchmark.py [number]
+
+import email
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'service_discovery'))
+
+from headers import Headers
+
+SSDP_RESPONSE = (b'HTTP/1.1 200 OK\r\n'
+                 b'CACHE-CONTROL: max-age=1800\r\n'
+                 b'DATE: Fri, 06 Sep 2013 08:00:00 GMT\r\n'
+                 b'EXT:\r\n'
+                 b'LOCATION: http://192.168.1.20:49152/description.xml\r\n'
+                 b'SERVER: Linux/3.4 UPnP/1.0 MediaServer/1.0\r\n'
+                 b'ST: upnp:rootdevice\r\n'
+                 b'USN: uuid:4d696e69-444c-164e-9d41-001cc0a8c0a8'
+                 b'::upnp:rootdevice\r\n'
+                 b'BOOTID.UPNP.ORG: 1\r\n'
+                 b'CONFIGID.UPNP.ORG: 1\r\n'
+                 b'\r\n')
+
+
+def email_key(data):
+    if not isinstance(data, str):
+        data = data.decode('latin-1')
+    response_status, header = data.split('\r\n', 1)
+    headers = email.message_from_string(header)
+    return headers.get('USN')
+
+
+def email_record(data):
+    if not isinstance(data, str):
+        data = data.decode('latin-1')
+    response_status, header = data.split('\r\n', 1)
+    headers = email.message_from_string(header)
+    return dict(headers.items())
+
+
+def headers_key(data):
+    return Headers(data).get('USN')
+
+
+def headers_record(data):
+    return dict(Headers(data).items())
+
+
+def main(number):
+    cases = [
+        ('dedup key, email', email_key, SSDP_RESPONSE),
+        ('dedup key, Headers', headers_key, SSDP_RESPONSE),
+        ('dedup key, Headers(memoryview)', headers_key,
+         memoryview(bytearray(SSDP_RESPONSE))),
+        ('full record, email', email_record, SSDP_RESPONSE),
+        ('full record, Headers', headers_record, SSDP_RESPONSE),
+    ]
+    for label, func, data in cases:
+        seconds = min(timeit.repeat(lambda: func(data), number=number,
+                                    repeat=3))
+        print('%-32s %8.2f us/datagram' % (label, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Compare the memory held by a fleet of server records kept as the dicts
+# discover() returns with the same records kept as record.DeviceRecord.
+#
+#   python benchmarks/record_memory_benchmark.py [count]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'service_discovery'))
+
+from headers import Headers
+from record import DeviceRecord
+
+SSDP_RESPONSE = ('HTTP/1.1 200 OK\r\n'
+                 'CACHE-CONTROL: max-age=1800\r\n'
+                 'DATE: Fri, 06 Sep 2013 08:00:00 GMT\r\n'
+                 'EXT:\r\n'
+                 'LOCATION: http://10.%d.%d.%d:49152/description.xml\r\n'
+                 'SERVER: Linux/3.4 UPnP/1.0 MediaServer/1.0\r\n'
+                 'ST: upnp:rootdevice\r\n'
+                 'USN: uuid:4d696e69-444c-164e-9d41-%012x::upnp:rootdevice\r\n'
+                 'BOOTID.UPNP.ORG: 1\r\n'
+                 'CONFIGID.UPNP.ORG: 1\r\n'
+                 '\r\n')
+
+
+def responses(count):
+    for i in range(count):
+        data = SSDP_RESPONSE % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff, i)
+        yield Headers(data.encode('ascii'))
+
+
+def deep_size(obj, seen):
+    # count every object once, so that strings shared through interning
+    # are only paid for once across the whole fleet
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_size(k, seen) + deep_size(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_size(item, seen)
+    elif isinstance(obj, DeviceRecord):
+        for slot in DeviceRecord.__slots__:
+            size += deep_size(getattr(obj, slot), seen)
+    return size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    dicts = [dict(headers.items()) for headers in responses(count)]
+    records = [DeviceRecord(headers)
+               for headers in responses(count)]
+    dict_size = deep_size(dicts, set())
+    record_size = deep_size(records, set())
+    print('%d records' % count)
+    print('dict:         %10d bytes (%d per record)' %
+          (dict_size, dict_size // count))
+    print('DeviceRecord: %10d bytes (%d per record)' %
+          (record_size, record_size // count))
+    print('saved:        %9.1f%%' % (100.0 * (dict_size - record_size) /
+                                     dict_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,4 +3,4 @@
 
 __author__ = 'Grey Lee'
 __email__ = 'bcse@bcse.tw'
-__version__ = '0.1.0'
\ No newline at end of file
+__version__ = '0.1.0'
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# asyncio variants of engine.scan, ssdpclient.discover and
+# gdmclient.discover.
+#
+# This module requires Python 3.6+ and is not imported by the rest of the
+# package, so the blocking clients keep working on Python 2.
+
+import asyncio
+import socket
+import struct
+
+from .headers import Headers
+from .interfaces import resolve, table
+from .protocols import GDM, SSDP
+
+
+class DiscoveryProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.on_datagram(data, addr)
+
+    def error_received(self, exc):
+        # in non-connected UDP ECONNREFUSED is platform dependent and not
+        # useful to the caller, same as BroadcastSocket/MulticastSocket
+        pass
+
+
+class BroadcastProtocol(DiscoveryProtocol):
+    pass
+
+
+class MulticastProtocol(DiscoveryProtocol):
+
+    def __init__(self, on_datagram, interface, group_addresses, ttl=1):
+        DiscoveryProtocol.__init__(self, on_datagram)
+        self.interface = interface
+        self.group_addresses = group_addresses
+        self.ttl = ttl
+
+    def _membership(self, group_address):
+        return (socket.inet_aton(group_address) +
+                socket.inet_aton(self.interface))
+
+    def connection_made(self, transport):
+        DiscoveryProtocol.connection_made(self, transport)
+        sock = transport.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF,
+                        socket.inet_aton(self.interface))
+        # multicast will cross router hops if TTL > 1
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL,
+                        struct.pack('B', self.ttl))
+        for group_address in self.group_addresses:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                            self._membership(group_address))
+
+    def close(self):
+        sock = self.transport.get_extra_info('socket')
+        for group_address in self.group_addresses:
+            try:
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP,
+                                self._membership(group_address))
+            except OSError:
+                pass
+        self.transport.close()
+
+
+async def iter_scan(protocols, interface=None, timeout=1.0, until=None):
+    """Async counterpart of `engine.scan`: yield `(protocol, key,
+    server_info)` for each server as soon as it answers.
+    """
+    loop = asyncio.get_event_loop()
+    interfaces = resolve(interface)
+    group_addresses = []
+    for protocol in protocols:
+        if protocol.group[0] not in group_addresses:
+            group_addresses.append(protocol.group[0])
+
+    queue = asyncio.Queue()
+    seen = set()
+
+    def on_datagram(data, server):
+        headers = Headers(data)
+        for protocol in protocols:
+            res_id = protocol.response_key(headers)
+            if res_id is not None:
+                break
+        else:
+            return
+        if (protocol, res_id) not in seen:
+            seen.add((protocol, res_id))
+            queue.put_nowait((protocol, res_id,
+                              protocol.record(headers, server)))
+
+    endpoints = []
+    try:
+        # discover with multicast, one endpoint per interface
+        for address in interfaces:
+            if address is None:
+                address = socket.gethostbyname(socket.gethostname())
+            try:
+                transport, endpoint = await loop.create_datagram_endpoint(
+                    lambda: MulticastProtocol(on_datagram, address,
+                                              group_addresses),
+                    local_addr=(address, 0))
+            except OSError:
+                continue
+            endpoints.append(endpoint)
+            for protocol in protocols:
+                for probe in protocol.probes():
+                    transport.sendto(probe, protocol.group)
+
+        # discover with broadcast, sending to every destination from one
+        # endpoint
+        try:
+            transport, endpoint = await loop.create_datagram_endpoint(
+                lambda: BroadcastProtocol(on_datagram),
+                family=socket.AF_INET, allow_broadcast=True)
+        except OSError:
+            pass
+        else:
+            endpoints.append(endpoint)
+            for protocol in protocols:
+                for addr in table.broadcast_addresses(interfaces):
+                    for probe in protocol.probes():
+                        transport.sendto(probe, (addr, protocol.group[1]))
+
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                protocol, res_id, server_info = await asyncio.wait_for(
+                    queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            yield (protocol, res_id, server_info)
+            if until is not None and until(server_info):
+                break
+    finally:
+        for endpoint in endpoints:
+            if isinstance(endpoint, MulticastProtocol):
+                endpoint.close()
+            else:
+                endpoint.transport.close()
+
+
+async def _iter_discover(protocol, interface, timeout, until):
+    async for protocol, res_id, server_info in iter_scan(
+            [protocol], interface, timeout, until):
+        yield (res_id, server_info)
+
+
+def ssdp_iter_discover(interface=None, timeout=1.0, until=None):
+    return _iter_discover(SSDP(), interface, timeout, until)
+
+
+def gdm_iter_discover(interface=None, timeout=1.0, until=None):
+    return _iter_discover(GDM(), interface, timeout, until)
+
+
+async def ssdp_discover(interface=None, timeout=1.0):
+    return {res_id: server_info async for res_id, server_info
+            in ssdp_iter_discover(interface, timeout)}
+
+
+async def gdm_discover(interface=None, timeout=1.0):
+    return {res_id: server_info async for res_id, server_info
+            in gdm_iter_discover(interface, timeout)}
+
+
+if __name__ == '__main__':
+    import sys
+
+    async def main():
+        interface = sys.argv[1] if len(sys.argv) > 1 else 'all'
+        async for protocol, res_id, server_info in iter_scan(
+                [SSDP(), GDM()], interface):
+            print('[%s] %s' % (protocol.name, res_id))
+            for k, v in server_info.items():
+                print('    %s = %s' % (k, v))
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(main())
+    finally:
+        loop.close()
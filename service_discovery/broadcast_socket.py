@@ -29,6 +29,8 @@
 import os
 import socket
 
+from buffer_pool import recv_batch
+
 if os.name in ('nt', 'ce'):
     from errno import (WSAEWOULDBLOCK as EAGAIN,
                        WSAEINTR as EINTR,
@@ -50,6 +52,8 @@ else:
 
 class BroadcastSocket(socket.socket):
 
+    stats = None  # a DiscoveryStats, while one is collecting
+
     def __init__(self, max_packet_size=8192):
         self.max_packet_size = max_packet_size
 
@@ -62,6 +66,8 @@ class BroadcastSocket(socket.socket):
         try:
             self.sendto(datagram, addr)
         except socket.error, e:
+            if self.stats is not None:
+                self.stats.send_failed(self, addr)
             no = e.args[0]
             if no == EINTR:
                 return self.write(datagram, addr)
@@ -74,9 +80,16 @@ class BroadcastSocket(socket.socket):
                 return
             else:
                 raise
-
-    def read(self):
-        while True:
+        else:
+            if self.stats is not None:
+                self.stats.sent(self, len(datagram), addr)
+
+    def read(self, limit=None):
+        stats = self.stats
+        packets_read = 0
+        while limit is None or packets_read < limit:
+            if stats is not None:
+                stats.receive_call(self)
             try:
                 data, addr = self.recvfrom(self.max_packet_size)
             except socket.error, e:
@@ -87,84 +100,22 @@ class BroadcastSocket(socket.socket):
                     break
                 raise
             else:
+                packets_read += 1
+                if stats is not None:
+                    stats.received(self, len(data))
                 yield (data, addr)
 
-
-if __name__ == '__main__':
-    broadcast_addresses = ('<broadcast>', '255.255.255.255', '127.0.0.1')
-
-    # Plex GDM
-    broadcast_sockets = []
-    for addr in broadcast_addresses:
-        print addr
-        s = BroadcastSocket()
-        s.sender = addr
-        s.settimeout(1.0)
-        try:
-            s.write('M-SEARCH * HTTP/1.0', (addr, 32414))
-            broadcast_sockets.append(s)
-        except socket.error, e:
-            print e
-
-    import email
-    server_list = {}
-    for s in broadcast_sockets:
-        try:
-            for data, server in s.read():
-                response_status, header = data.split('\r\n', 1)
-                headers = email.message_from_string(header)
-                print s.sender, server
-                res_id = headers.get('Resource-Identifier')
-                if res_id is not None and res_id not in server_list:
-                    server_info = dict(headers.items())
-                    server_info['Address'] = server[0]
-                    server_list[res_id] = server_info
-        except socket.timeout:
-            pass
-        finally:
-            s.close()
-
-    for server in server_list.values():
-        for k, v in server.iteritems():
-            print k, '=', v
-        print
-
-
-    # SSDP
-    msg = ('M-SEARCH * HTTP/1.1\r\n'
-           'MX: 3\r\n'
-           'ST: upnp:rootdevice\r\n'
-           'HOST: 239.255.255.250:1900\r\n'
-           'MAN: "ssdp:discover"\r\n'
-           '\r\n')
-
-    broadcast_sockets = []
-    for addr in broadcast_addresses:
-        s = BroadcastSocket()
-        s.settimeout(1.0)
+    def read_into(self, pool, limit=None):
+        stats = self.stats
         try:
-            s.write(msg, (addr, 1900))
-            broadcast_sockets.append(s)
+            for data, addr in recv_batch(self, pool, limit, stats):
+                if stats is not None:
+                    stats.received(self, len(data))
+                yield (data, addr)
         except socket.error, e:
-            print e
-
-    import email
-    server_list = {}
-    for s in broadcast_sockets:
-        try:
-            for data, server in s.read():
-                response_status, header = data.split('\r\n', 1)
-                headers = email.message_from_string(header)
-                res_id = headers.get('USN')
-                if res_id is not None and res_id not in server_list:
-                    server_info = dict(headers.items())
-                    server_list[res_id] = server_info
-        except socket.timeout:
-            pass
-        finally:
-            s.close()
-
-    for server in server_list.values():
-        for k, v in server.iteritems():
-            print k, '=', v
-        print
+            no = e.args[0]
+            if no in _sockErrReadIgnore:
+                return
+            if no in _sockErrReadRefuse:
+                return
+            raise
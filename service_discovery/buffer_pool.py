@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Batched datagram receive into preallocated buffers.
+#
+# recv_batch() reads into the bytearrays of a BufferPool and yields
+# memoryview slices of them, so no bytes object is allocated per datagram.
+# On Python 2 it yields buffer objects instead, since zlib and re there
+# take buffers but not memoryviews.
+# On Linux it fetches a whole batch with a single recvmmsg(2) call via
+# ctypes; elsewhere it falls back to one recvfrom_into() per datagram.
+
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+import sys
+
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort),
+                ('sin_port', ctypes.c_uint16),
+                ('sin_addr', ctypes.c_uint32),
+                ('sin_zero', ctypes.c_ubyte * 8)]
+
+
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint32),
+                ('msg_iov', ctypes.POINTER(_iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+
+def _load_recvmmsg():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr),
+                         ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+_recvmmsg = _load_recvmmsg()
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+
+try:
+    buffer
+except NameError:  # Python 3
+    def _datagram(pool, i, nbytes):
+        return pool.views[i][:nbytes]
+else:
+    def _datagram(pool, i, nbytes):
+        return buffer(pool.buffers[i], 0, nbytes)
+
+
+class BufferPool(object):
+
+    def __init__(self, count=32, size=8192):
+        self.size = size
+        self.buffers = [bytearray(size) for i in range(count)]
+        self.views = [memoryview(b) for b in self.buffers]
+
+        if _recvmmsg is not None:
+            self._names = (_sockaddr_in * count)()
+            self._iovecs = (_iovec * count)()
+            self._msgvec = (_mmsghdr * count)()
+            self._arrays = [(ctypes.c_char * size).from_buffer(b)
+                            for b in self.buffers]
+            for i in range(count):
+                self._iovecs[i].iov_base = ctypes.addressof(self._arrays[i])
+                self._iovecs[i].iov_len = size
+                hdr = self._msgvec[i].msg_hdr
+                hdr.msg_name = ctypes.addressof(self._names[i])
+                hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+                hdr.msg_iovlen = 1
+
+    def __len__(self):
+        return len(self.buffers)
+
+
+def _recv_batch_mmsg(sock, pool, limit, stats):
+    fd = sock.fileno()
+    namelen = ctypes.sizeof(_sockaddr_in)
+    while True:
+        # never take more datagrams off the queue than will be yielded
+        count = len(pool) if limit is None else min(len(pool), limit)
+        if count <= 0:
+            return
+        for i in range(count):
+            pool._msgvec[i].msg_hdr.msg_namelen = namelen
+        if stats is not None:
+            stats.receive_call(sock)
+        n = _recvmmsg(fd, pool._msgvec, count, _MSG_DONTWAIT, None)
+        if n < 0:
+            no = ctypes.get_errno()
+            raise socket.error(no, os.strerror(no))
+        for i in range(n):
+            name = pool._names[i]
+            # sin_port and sin_addr are in network byte order
+            addr = (socket.inet_ntoa(struct.pack('=I', name.sin_addr)),
+                    socket.ntohs(name.sin_port))
+            yield (_datagram(pool, i, pool._msgvec[i].msg_len), addr)
+        if n < count:
+            # the receive queue is drained
+            return
+        if limit is not None:
+            limit -= n
+
+
+def _recv_batch_into(sock, pool, limit, stats):
+    while True:
+        for i, view in enumerate(pool.views):
+            if limit is not None:
+                if limit <= 0:
+                    return
+                limit -= 1
+            if stats is not None:
+                stats.receive_call(sock)
+            nbytes, addr = sock.recvfrom_into(view)
+            yield (_datagram(pool, i, nbytes), addr)
+
+
+def recv_batch(sock, pool, limit=None, stats=None):
+    """Yield `(memoryview, addr)` for the datagrams queued on the
+    non-blocking `sock`, at most `limit` of them, or `(buffer, addr)` on
+    Python 2. Once the queue is empty
+    the generator either ends or raises `socket.error` with EAGAIN, like
+    `recvfrom()` would.
+
+    The views point into `pool` and are overwritten by later datagrams, so
+    consume each one before advancing the generator. Each receive syscall
+    is reported to `stats`, if given.
+    """
+    if _recvmmsg is not None:
+        return _recv_batch_mmsg(sock, pool, limit, stats)
+    return _recv_batch_into(sock, pool, limit, stats)
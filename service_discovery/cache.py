@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from headers import find_header
+except ImportError:  # Python 3
+    from .headers import find_header
+
+_max_age_re = re.compile(r'max-age\s*=\s*"?(\d+)', re.I)
+
+# json handles header values as latin-1 like the rest of the package
+_json_options = {'encoding': 'latin-1'} if str is bytes else {}
+
+
+def _native(value):
+    if str is bytes and not isinstance(value, str):
+        return value.encode('latin-1')
+    return value
+
+
+def max_age(server_info, default=None):
+    cache_control = find_header(server_info, 'CACHE-CONTROL')
+    if cache_control is not None:
+        m = _max_age_re.search(cache_control)
+        if m is not None:
+            return int(m.group(1))
+    return default
+
+
+class DeviceCache(object):
+    """Discovered servers keyed by USN / Resource-Identifier, each expiring
+    after the max-age of its CACHE-CONTROL header.
+
+    Expiry times are kept in a heap, so adding an entry and evicting one
+    are O(log n). Re-adding a key leaves its old heap item behind; those are
+    skipped on eviction and dropped when the heap grows to twice the number
+    of entries.
+    """
+
+    def __init__(self, default_max_age=1800, clock=time.time):
+        self.default_max_age = default_max_age
+        self.clock = clock
+        self._entries = {}
+        self._heap = []
+
+    def add(self, key, server_info):
+        age = max_age(server_info, self.default_max_age)
+        if age <= 0:
+            self._entries.pop(key, None)
+            return
+        expires = self.clock() + age
+        self._entries[key] = (expires, server_info)
+        heapq.heappush(self._heap, (expires, key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._compact()
+
+    def update(self, key, server_info):
+        """Replace the server_info of a cached `key`, keeping its expiry."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (entry[0], server_info)
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+        del self._heap[:]
+
+    def expire(self, now=None):
+        if now is None:
+            now = self.clock()
+        heap = self._heap
+        entries = self._entries
+        expired = []
+        while heap and heap[0][0] <= now:
+            expires, key = heapq.heappop(heap)
+            entry = entries.get(key)
+            if entry is not None and entry[0] == expires:
+                del entries[key]
+                expired.append((key, entry[1]))
+        return expired
+
+    def _compact(self):
+        self._heap = [(expires, key)
+                      for key, (expires, server_info) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            return default
+        return entry[1]
+
+    def expires(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def items(self):
+        now = self.clock()
+        return [(key, server_info)
+                for key, (expires, server_info) in self._entries.items()
+                if expires > now]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        self.expire()
+        return len(self._entries)
+
+
+class PersistentDeviceCache(DeviceCache):
+    """A `DeviceCache` kept in the file at `path`, so that a restarted
+    process knows its servers before it has probed for them.
+
+    The file is an append-only log with one JSON line per change: an
+    added server with the time it was last seen and its max-age, or a
+    removed one. It is rewritten with only the live servers when it grows
+    to twice their number, and when it is opened. A line cut short by a
+    crash is ignored.
+
+    Servers loaded from the file are in `warm` until they are added again;
+    `revalidate()` probes for them in the background and forgets those
+    that do not answer.
+    """
+
+    def __init__(self, path, default_max_age=1800, clock=time.time):
+        DeviceCache.__init__(self, default_max_age, clock)
+        self.path = path
+        self.warm = set()
+        self._lock = threading.RLock()
+        self._log = None
+        self._lines = 0
+        self._revalidating = False
+        self._load()
+
+    def _load(self):
+        now = self.clock()
+        servers = {}
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        change = json.loads(line.decode('latin-1'))
+                    except ValueError:
+                        continue
+                    if change[0] == '+':
+                        servers[_native(change[1])] = change[2:]
+                    else:
+                        servers.pop(_native(change[1]), None)
+        except IOError:
+            pass
+        for key, (last_seen, age, server_info) in servers.items():
+            expires = last_seen + age
+            if expires > now:
+                self._entries[key] = (expires, dict(
+                    (_native(k), _native(v)) for k, v in server_info.items()))
+        self._compact()
+        self.warm.update(self._entries)
+        self._rewrite()
+
+    def _append(self, change):
+        self._log.write(json.dumps(change, **_json_options).encode('latin-1')
+                        + b'\n')
+        self._log.flush()
+        self._lines += 1
+        if self._lines > 2 * len(self._entries) + 64:
+            self._rewrite()
+
+    def _rewrite(self):
+        # write the live servers aside and rename over the log, so that a
+        # crash leaves either the old log or the new one
+        if self._log is not None:
+            self._log.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            for key, (expires, server_info) in self._entries.items():
+                age = max_age(server_info, self.default_max_age)
+                f.write(json.dumps(['+', key, expires - age, age,
+                                    dict(server_info.items())],
+                                   **_json_options).encode('latin-1') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, self.path)
+        self._log = open(self.path, 'ab')
+        self._lines = len(self._entries)
+
+    def add(self, key, server_info):
+        with self._lock:
+            DeviceCache.add(self, key, server_info)
+            self.warm.discard(key)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._append(['-', key])
+            else:
+                age = max_age(server_info, self.default_max_age)
+                self._append(['+', key, entry[0] - age, age,
+                              dict(server_info.items())])
+
+    def update(self, key, server_info):
+        with self._lock:
+            DeviceCache.update(self, key, server_info)
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = max_age(server_info, self.default_max_age)
+                self._append(['+', key, entry[0] - age, age,
+                              dict(server_info.items())])
+
+    def remove(self, key):
+        with self._lock:
+            DeviceCache.remove(self, key)
+            self.warm.discard(key)
+            self._append(['-', key])
+
+    def clear(self):
+        with self._lock:
+            DeviceCache.clear(self)
+            self.warm.clear()
+            self._rewrite()
+
+    def expire(self, now=None):
+        with self._lock:
+            return DeviceCache.expire(self, now)
+
+    def items(self):
+        with self._lock:
+            return DeviceCache.items(self)
+
+    def close(self):
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def revalidate(self, probe, keys=None):
+        """Call `probe()` in a background thread, then remove the servers
+        of `keys` (all of them by default) that are still warm, i.e. that
+        `probe()` did not add again. Does nothing while a revalidation is
+        running.
+        """
+        with self._lock:
+            if self._revalidating:
+                return
+            self._revalidating = True
+
+        def run():
+            try:
+                try:
+                    probe()
+                except EnvironmentError:
+                    # e.g. the network is down; keep the servers for now
+                    return
+                with self._lock:
+                    for key in list(self.warm if keys is None else keys):
+                        if key in self.warm:
+                            self.remove(key)
+            finally:
+                self._revalidating = False
+
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        return t
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import errno
+import json
+import os
+import select
+import socket
+import threading
+import time
+
+from cache import DeviceCache, PersistentDeviceCache, _json_options, _native
+from engine import scan
+from notify_listener import NotifyListener
+from protocols import GDM, SSDP
+from record import DeviceRecord
+from shared_table import SharedDeviceTable
+
+
+class Snapshot(object):
+    """Read-only mapping of the devices known at one point in time, keyed
+    by USN / Resource-Identifier. `version` grows with every snapshot a
+    daemon publishes.
+    """
+
+    __slots__ = ('version', 'time', '_devices', '_json')
+
+    def __init__(self, devices, version=0, time=None):
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'time', time)
+        object.__setattr__(self, '_devices', devices)
+        object.__setattr__(self, '_json', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Snapshot is read-only')
+
+    def get(self, key, default=None):
+        return self._devices.get(key, default)
+
+    def __getitem__(self, key):
+        return self._devices[key]
+
+    def __contains__(self, key):
+        return key in self._devices
+
+    def __iter__(self):
+        return iter(self._devices)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def keys(self):
+        return list(self._devices.keys())
+
+    def values(self):
+        return list(self._devices.values())
+
+    def items(self):
+        return list(self._devices.items())
+
+    def to_json(self):
+        # serialised once, however many processes ask for it
+        if self._json is None:
+            data = json.dumps({
+                'version': self.version,
+                'time': self.time,
+                'devices': dict((key, dict(record.items()))
+                                for key, record in self._devices.items()),
+            }, **_json_options)
+            object.__setattr__(self, '_json', data.encode('latin-1'))
+        return self._json
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data.decode('latin-1'))
+        devices = dict(
+            (_native(key), DeviceRecord(dict((_native(k), _native(v))
+                                             for k, v in info.items())))
+            for key, info in data['devices'].items())
+        return cls(devices, data['version'], data['time'])
+
+
+class DiscoveryDaemon(object):
+    """Keep the devices on the LAN up to date in the background, so that
+    any number of threads and processes can share one discovery.
+
+    Every `interval` seconds `protocols` are probed for `timeout` seconds,
+    and in between SSDP NOTIFY announcements are followed (unless `listen`
+    is false). Devices leave when they say byebye or their max-age
+    expires.
+
+    Each change publishes a new immutable `Snapshot`. `snapshot()` only
+    returns the current one, so readers never take a lock and never see a
+    snapshot change under them. With `socket_path`, other processes can
+    read it through a Unix socket, see `fetch_snapshot`. With `table_path`,
+    every snapshot is also written to a `SharedDeviceTable` there, which
+    worker processes can map and read without any IPC round trip.
+
+    With `cache_path`, the devices are also kept in a
+    `PersistentDeviceCache` there: a restarted daemon starts from the
+    devices still within their max-age, and forgets those that do not
+    answer its first probe.
+    """
+
+    def __init__(self, interface=None, protocols=None, interval=60.0,
+                 timeout=2.0, retries=1, listen=True, socket_path=None,
+                 table_path=None, table_capacity=1024, cache_path=None,
+                 tick=1.0):
+        self.interface = interface
+        self.protocols = protocols or [SSDP(), GDM()]
+        self.interval = interval
+        self.timeout = timeout
+        self.retries = retries
+        self.socket_path = socket_path
+        self.table_path = table_path
+        self.table_capacity = table_capacity
+        self.table = None
+        self.tick = tick
+        if cache_path is not None:
+            self.cache = PersistentDeviceCache(cache_path)
+        else:
+            self.cache = DeviceCache()
+        self.listener = None
+        if listen:
+            # the listener joins on one interface, or on the default one
+            single = interface if interface != 'all' and \
+                not isinstance(interface, (list, tuple)) else None
+            self.listener = NotifyListener(single, tick)
+        self.ready = threading.Event()
+        self._snapshot = Snapshot(dict((key, DeviceRecord(server_info))
+                                       for key, server_info
+                                       in self.cache.items()),
+                                  0, time.time())
+        if len(self._snapshot):
+            # warm start, no need to wait for the first probe
+            self.ready.set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._server = None
+
+    def snapshot(self):
+        return self._snapshot
+
+    def _publish(self):
+        # called with the lock held; the new snapshot is built aside and
+        # swapped in with a single assignment
+        self._snapshot = Snapshot(dict(self.cache.items()),
+                                  self._snapshot.version + 1, time.time())
+        if self.table is not None:
+            self.table.publish(self._snapshot.items())
+
+    def _on_notify(self, event):
+        def callback(usn, server_info):
+            with self._lock:
+                if event == 'remove':
+                    self.cache.remove(usn)
+                else:
+                    self.cache.add(usn, DeviceRecord(server_info))
+                self._publish()
+        return callback
+
+    def probe(self):
+        """Probe once and publish what was found."""
+        found = list(scan(self.protocols, self.interface, self.timeout,
+                          retries=self.retries))
+        with self._lock:
+            for protocol, key, server_info in found:
+                self.cache.add(key, DeviceRecord(server_info))
+            # devices from a previous run that did not answer
+            for key in list(getattr(self.cache, 'warm', ())):
+                self.cache.remove(key)
+            self.cache.expire()
+            self._publish()
+        self.ready.set()
+
+    def _probe_loop(self):
+        while not self._stopped.is_set():
+            try:
+                self.probe()
+            except socket.error:
+                # e.g. the network is down; try again next round
+                pass
+            self._stopped.wait(self.interval)
+
+    def _serve(self):
+        while not self._stopped.is_set():
+            readable, _, _ = select.select([self._server], [], [], self.tick)
+            if not readable:
+                continue
+            try:
+                conn, _ = self._server.accept()
+            except socket.error:
+                continue
+            try:
+                conn.sendall(self._snapshot.to_json())
+            except socket.error:
+                pass
+            finally:
+                conn.close()
+
+    def _open_server(self):
+        try:
+            os.unlink(self.socket_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(16)
+        self._server = server
+
+    def _start_thread(self, target):
+        t = threading.Thread(target=target)
+        t.daemon = True
+        t.start()
+        self._threads.append(t)
+
+    def start(self):
+        self._stopped.clear()
+        if self.table_path is not None:
+            self.table = SharedDeviceTable.create(self.table_path,
+                                                  self.table_capacity)
+            self.table.publish(self._snapshot.items())
+        if self.listener is not None:
+            for event in self.listener.events:
+                self.listener.subscribe(event, self._on_notify(event))
+            self.listener.start()
+        if self.socket_path is not None:
+            self._open_server()
+            self._start_thread(self._serve)
+        self._start_thread(self._probe_loop)
+
+    def stop(self):
+        self._stopped.set()
+        if self.listener is not None:
+            self.listener.stop()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            os.unlink(self.socket_path)
+        if self.table is not None:
+            # the file stays, so that workers can still read the last devices
+            self.table.close()
+            self.table = None
+
+
+def fetch_snapshot(socket_path, timeout=5.0):
+    """Return the current `Snapshot` of the daemon serving `socket_path`."""
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(socket_path)
+        chunks = []
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        s.close()
+    return Snapshot.from_json(b''.join(chunks))
+
+
+if __name__ == '__main__':
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else '/tmp/service_discovery.sock'
+    daemon = DiscoveryDaemon(interface='all', socket_path=path)
+    daemon.start()
+    try:
+        while True:
+            time.sleep(daemon.interval)
+            print('%d device(s), version %d' % (len(daemon.snapshot()),
+                                                daemon.snapshot().version))
+    except KeyboardInterrupt:
+        daemon.stop()
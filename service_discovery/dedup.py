@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import zlib
+from collections import OrderedDict
+
+try:
+    zlib.crc32(memoryview(b''))
+    _crc32 = zlib.crc32
+except TypeError:
+    # Python 2 only takes strings and buffers, which is what recv_batch
+    # yields there; anything else is copied
+    def _crc32(data):
+        if isinstance(data, (bytearray, memoryview)):
+            data = memoryview(data).tobytes()
+        return zlib.crc32(data)
+
+
+class DatagramFilter(object):
+    """Recognises datagrams already received from the same source, before
+    they are parsed.
+
+    A datagram is identified by the CRC-32 and length of its raw bytes and
+    by its source address, so copies of one response arriving on the
+    multicast and broadcast sockets, or answering retransmitted probes, are
+    caught without copying or parsing them. The `size` most recently seen
+    identities are kept, least recently seen ones are forgotten first.
+    `hits` and `misses` count duplicates and new datagrams.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._seen = OrderedDict()
+
+    def seen(self, data, addr):
+        """Return whether `data` from `addr` was already seen, and remember
+        it otherwise."""
+        key = (_crc32(data), len(data), addr)
+        if key in self._seen:
+            # refresh, so that a chatty source stays remembered
+            del self._seen[key]
+            self._seen[key] = True
+            self.hits += 1
+            return True
+        self._seen[key] = True
+        if len(self._seen) > self.size:
+            self._seen.popitem(last=False)
+        self.misses += 1
+        return False
+
+    def clear(self):
+        self._seen.clear()
+        self.hits = self.misses = 0
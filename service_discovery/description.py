@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Device description fetching.
+#
+# An SSDP response only points at the device description with its LOCATION
+# header. DescriptionFetcher downloads the descriptions of many servers at
+# once from a bounded set of worker threads, keeps one keep-alive connection
+# per host, and remembers what it parsed by LOCATION and BOOTID.UPNP.ORG, so
+# that the description of a device that has not rebooted is only fetched
+# once.
+
+import io
+import socket
+import threading
+import xml.etree.ElementTree as ElementTree
+
+try:
+    import httplib
+    import Queue as queue
+    from urlparse import urlsplit
+except ImportError:  # Python 3
+    import http.client as httplib
+    import queue
+    from urllib.parse import urlsplit
+
+try:
+    from headers import find_header
+except ImportError:  # Python 3
+    from .headers import find_header
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+FIELDS = ('deviceType', 'friendlyName', 'manufacturer', 'modelName',
+          'modelNumber', 'UDN', 'presentationURL', 'serviceList')
+
+
+def parse_description(source, fields=FIELDS):
+    """Return `fields` of the root device of a UPnP description as a dict,
+    e.g. `friendlyName` and `modelName`. `serviceList` is returned as a
+    list of dicts, one per service. With `fields=None`, every simple field
+    of the root device is returned.
+
+    `source` is the document, or a file-like object such as an HTTP
+    response, which is parsed incrementally as it is read. Elements are
+    dropped once they are parsed, so icon lists, embedded devices and large
+    service lists do not pile up in memory, and parsing stops as soon as
+    every field is found.
+    """
+    if not hasattr(source, 'read'):
+        source = io.BytesIO(source)
+    wanted = set(fields) if fields is not None else None
+    description = {}
+    services = []
+    path = []
+    stack = []
+    leaves = []
+    for event, element in ElementTree.iterparse(source, ('start', 'end')):
+        if event == 'start':
+            path.append(_local_name(element.tag))
+            stack.append(element)
+            if leaves:
+                leaves[-1] = False
+            leaves.append(True)
+            continue
+
+        name = path.pop()
+        stack.pop()
+        leaf = leaves.pop()
+        depth = len(path)  # of the parent
+        if depth == 1 and name == 'device':
+            break
+        if depth < 2 or path[1] != 'device':
+            if stack:
+                stack[-1].clear()
+        elif depth == 2:
+            # a child of the root device
+            if name == 'serviceList':
+                if wanted is None or name in wanted:
+                    description[name] = services
+            elif leaf and (wanted is None or name in wanted):
+                description[name] = (element.text or '').strip()
+            stack[-1].clear()
+            if wanted is not None and wanted.issubset(description):
+                break
+        elif path[2] != 'serviceList':
+            # icons, embedded devices and anything else nobody asked for
+            stack[-1].clear()
+        elif depth == 3:
+            # a service of the root device
+            if wanted is None or 'serviceList' in wanted:
+                services.append(dict(
+                    (_local_name(field.tag), (field.text or '').strip())
+                    for field in element))
+            stack[-1].clear()
+    return description
+
+
+class _ConnectionPool(object):
+    # idle keep-alive connections, per (scheme, host:port)
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, scheme, netloc, fresh=False):
+        if not fresh:
+            with self._lock:
+                idle = self._idle.get((scheme, netloc))
+                if idle:
+                    return idle.pop(), True
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(netloc, timeout=self.timeout)
+        return conn, False
+
+    def release(self, scheme, netloc, conn):
+        with self._lock:
+            self._idle.setdefault((scheme, netloc), []).append(conn)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class DescriptionFetcher(object):
+    """Fetch and parse device descriptions concurrently.
+
+    At most `workers` requests are in flight at a time. Parsed descriptions
+    are cached by `(LOCATION, BOOTID.UPNP.ORG)`; a device that reboots
+    announces a new BOOTID and is fetched again. Failed fetches are not
+    cached.
+    """
+
+    def __init__(self, workers=8, timeout=5.0, parse=parse_description):
+        self.workers = workers
+        self.timeout = timeout
+        self.parse = parse
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._connections = _ConnectionPool(timeout)
+
+    def _get(self, location):
+        url = urlsplit(location)
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        # a reused connection may have been closed by the server meanwhile,
+        # so give a failing one a second try on a fresh connection; the
+        # other idle ones to the same host are likely just as stale
+        fresh = False
+        while True:
+            conn, reused = self._connections.acquire(url.scheme, url.netloc,
+                                                     fresh)
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                if reused:
+                    fresh = True
+                    continue
+                raise
+            try:
+                if response.status != 200:
+                    raise httplib.HTTPException('%s: HTTP %d' %
+                                                (location, response.status))
+                # parse while the body arrives
+                description = self.parse(response)
+                # skip what the parser did not need to keep the connection
+                while response.read(8192):
+                    pass
+            except Exception:
+                conn.close()
+                raise
+            if response.will_close:
+                conn.close()
+            else:
+                self._connections.release(url.scheme, url.netloc, conn)
+            return description
+
+    def fetch(self, location, bootid=None):
+        """Return the parsed description at `location`, from the cache if
+        it was already fetched for this `bootid`.
+        """
+        key = (location, bootid)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        description = self._get(location)
+        if description is not None:
+            with self._lock:
+                self._cache[key] = description
+        return description
+
+    def fetch_all(self, keys):
+        """Fetch every `(location, bootid)` in `keys` concurrently and
+        return `{(location, bootid): description}` for the ones that
+        succeeded.
+        """
+        results = {}
+        jobs = queue.Queue()
+        for key in set(keys):
+            jobs.put(key)
+
+        def work():
+            while True:
+                try:
+                    key = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    description = self.fetch(*key)
+                except (socket.error, httplib.HTTPException,
+                        ElementTree.ParseError):
+                    continue
+                results[key] = description
+
+        threads = [threading.Thread(target=work)
+                   for i in range(min(self.workers, jobs.qsize()))]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def describe(self, server_list):
+        """Return `{USN: description}` for the servers of a `discover()`
+        result. Servers sharing a LOCATION are fetched once.
+        """
+        keys = {}
+        for usn, server_info in server_list.items():
+            location = find_header(server_info, 'LOCATION')
+            if location:
+                keys[usn] = (location,
+                             find_header(server_info, 'BOOTID.UPNP.ORG'))
+        descriptions = self.fetch_all(keys.values())
+        return dict((usn, descriptions[key]) for usn, key in keys.items()
+                    if key in descriptions)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        self._connections.close()
+
+
+default_fetcher = DescriptionFetcher()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import time
+
+from buffer_pool import BufferPool
+from dedup import DatagramFilter
+from headers import Headers
+from interfaces import resolve, table
+from receiver import ReadBudget, receive
+from scheduler import ProbeScheduler, mx_window
+from socket_pool import default_pool
+from stats import DiscoveryStats, observers
+
+
+def _send(protocols, multicast_sockets, broadcast_socket, interfaces):
+    for s in multicast_sockets:
+        for protocol in protocols:
+            for probe in protocol.probes():
+                try:
+                    s.write(probe, protocol.group)
+                except socket.error:
+                    pass
+
+    for protocol in protocols:
+        for addr in table.broadcast_addresses(interfaces):
+            for probe in protocol.probes():
+                try:
+                    broadcast_socket.write(probe, (addr, protocol.group[1]))
+                except socket.error:
+                    pass
+
+
+def scan(protocols, interface=None, timeout=1.0, until=None, cache=None,
+         socket_pool=None, retries=0, quiet=None, registry=None,
+         duplicates=None, budget=None, stats=None):
+    """Probe for every protocol in `protocols` over shared sockets and
+    yield `(protocol, key, server_info)` for each server as soon as it
+    answers.
+
+    Stops at `timeout`, or right after a server for which
+    `until(server_info)` is true. Servers are also added to `cache` and
+    `registry`, if given.
+
+    `interface` is a local address, a list of them, or 'all' to search on
+    every multicast capable interface at once.
+
+    Sockets are borrowed from `socket_pool`, or the module wide
+    `default_pool`, and returned to it afterwards.
+
+    The probes are retransmitted up to `retries` times at jittered points
+    of the MX window (see `ProbeScheduler`). Retransmission stops as soon
+    as one brings no new server. With `quiet`, the scan also ends once
+    every probe is out and no new server has answered for `quiet`
+    seconds.
+
+    Repeated datagrams are dropped before they are parsed by `duplicates`,
+    a `DatagramFilter` that also counts them; a new one is used for each
+    scan unless given.
+
+    Reading is shared fairly between the sockets within `budget`, a
+    `ReadBudget`. Its `truncated` count tells whether the scan ended with
+    responses still unread.
+
+    Metrics are collected into `stats`, a `DiscoveryStats`, or into a new
+    one whenever observers are registered with `stats.add_observer`.
+    """
+    if socket_pool is None:
+        socket_pool = default_pool
+    if duplicates is None:
+        duplicates = DatagramFilter()
+    if budget is None:
+        budget = ReadBudget()
+    if stats is None and observers:
+        stats = DiscoveryStats()
+    duplicate_hits = duplicates.hits
+
+    sockets = []
+    memberships = {}
+    interfaces = resolve(interface)
+    try:
+        # discover with multicast, one socket per interface
+        for interface in interfaces:
+            try:
+                s = socket_pool.acquire_multicast(interface)
+            except socket.error:
+                # e.g. the address is gone since the interface table was
+                # read; search on the other interfaces
+                continue
+            memberships[s] = []
+            sockets.append(s)
+            s.stats = stats
+            try:
+                s.set_outgoing_interface()
+                s.set_ttl(1)  # multicast will cross router hops if TTL > 1
+                for protocol in protocols:
+                    if protocol.group[0] not in memberships[s]:
+                        s.join_group(protocol.group[0])
+                        memberships[s].append(protocol.group[0])
+            except socket.error:
+                sockets.remove(s)
+                s.stats = None
+                for group_address in memberships.pop(s):
+                    s.leave_group(group_address)
+                socket_pool.release(s)
+        multicast_sockets = list(sockets)
+
+        # discover with broadcast, sending to every destination from one
+        # socket
+        broadcast_socket = socket_pool.acquire_broadcast()
+        sockets.append(broadcast_socket)
+        broadcast_socket.stats = stats
+
+        scheduler = ProbeScheduler(retries, mx_window(protocols, timeout))
+        sends = scheduler.times()
+        start = time.time()
+        deadline = start + timeout
+        pool = BufferPool()
+        seen = set()
+        while True:
+            now = time.time()
+            retransmitted = False
+            if sends and start + sends[0] <= now:
+                retransmitted = len(sends) <= retries
+                del sends[0]
+                _send(protocols, multicast_sockets, broadcast_socket,
+                      interfaces)
+
+            if sends:
+                end = min(start + sends[0], deadline)
+            elif quiet is not None:
+                end = min(now + quiet, deadline)
+            else:
+                end = deadline
+            waited_quietly = not sends and quiet is not None
+
+            new = 0
+            for s, data, server in receive(sockets, end - now, pool,
+                                           budget):
+                if duplicates.seen(data, server):
+                    continue
+                if stats is not None:
+                    parse_start = time.time()
+                headers = Headers(data)
+                for protocol in protocols:
+                    res_id = protocol.response_key(headers)
+                    if res_id is not None:
+                        break
+                if stats is not None:
+                    stats.parsed(time.time() - parse_start)
+                if res_id is None:
+                    continue
+                if (protocol, res_id) in seen:
+                    continue
+                seen.add((protocol, res_id))
+                new += 1
+                if stats is not None:
+                    if s is broadcast_socket:
+                        destination = table.broadcast_destination(
+                            server[0], interfaces)
+                    else:
+                        destination = protocol.group[0]
+                    stats.response(server[0], time.time() - start,
+                                   destination)
+                server_info = protocol.record(headers, server)
+                if cache is not None:
+                    cache.add(res_id, server_info)
+                if registry is not None:
+                    registry.add(res_id, server_info, server[0])
+                yield (protocol, res_id, server_info)
+                if until is not None and until(server_info):
+                    return
+
+            if time.time() >= deadline:
+                budget.truncated += len(budget.behind)
+                break
+            if not new:
+                if retransmitted:
+                    # the last retransmission found nothing new
+                    del sends[:]
+                elif waited_quietly:
+                    break
+    finally:
+        for s in sockets:
+            s.stats = None
+            for group_address in memberships.get(s, ()):
+                s.leave_group(group_address)
+            socket_pool.release(s)
+        if stats is not None:
+            stats.duplicates += duplicates.hits - duplicate_hits
+            stats.publish()
+
+
+if __name__ == '__main__':
+    import sys
+
+    from protocols import GDM, SSDP
+
+    interface = sys.argv[1] if len(sys.argv) > 1 else 'all'
+    budget = ReadBudget()
+    stats = DiscoveryStats()
+    for protocol, res_id, server_info in scan([SSDP(), GDM()], interface,
+                                              budget=budget, stats=stats):
+        print('[%s] %s' % (protocol.name, res_id))
+        for k, v in server_info.items():
+            print('    %s = %s' % (k, v))
+    print('%d probe(s) sent, %d datagram(s) received in %d call(s), '
+          '%d duplicate(s) dropped' % (stats.sends, stats.datagrams,
+                                       stats.receive_calls, stats.duplicates))
+    for destination, count in sorted(stats.responses_by_destination.items()):
+        print('%d server(s) answered via %s' % (count, destination))
+    if budget.truncated:
+        print('%d socket(s) still had unread responses' % budget.truncated)
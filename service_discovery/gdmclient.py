@@ -2,71 +2,50 @@
 # -*- coding: utf-8 -*-
 
 import socket
-import email
 
-from broadcast_socket import BroadcastSocket
-from multicast_socket import MulticastSocket
+from engine import scan
+from headers import find_header
+from protocols import GDM
 
 
-def discover(interface=None, timeout=1.0):
-    gdm_group = ('239.0.0.250', 32414)
-    msg = 'M-SEARCH * HTTP/1.0'
+def iter_discover(interface=None, timeout=1.0, until=None, cache=None,
+                  socket_pool=None, retries=0, quiet=None, registry=None,
+                  duplicates=None, budget=None, stats=None):
+    """Yield `(Resource-Identifier, server_info)` for each server as soon
+    as it answers.
 
-    sockets = []
-
-    # discover with multicast
-    s = MulticastSocket(interface=interface)
-    s.set_outgoing_interface()
-    s.set_ttl(1)  # multicast will cross router hops if TTL > 1
-    s.settimeout(timeout)
-    s.join_group(gdm_group[0])
+    See `engine.scan` for the arguments.
+    """
+    results = scan([GDM()], interface, timeout, until, cache, socket_pool,
+                   retries, quiet, registry, duplicates, budget, stats)
     try:
-        s.write(msg, gdm_group)
-    except socket.error:
-        s.leave_group(gdm_group[0])
-        s.close()
-    else:
-        sockets.append(s)
-
-    # discover with broadcast
-    broadcast_addresses = ['<broadcast>', '255.255.255.255', '127.0.0.1']
-    if interface is None:
-        pass
-    elif interface.startswith('192.168.'):
-        addr = '.'.join(interface.split('.')[:3] + ['255'])
-        broadcast_addresses.insert(0, addr)
-    elif interface.startswith('10.'):
-        broadcast_addresses.insert(0, '10.255.255.255')
-
-    for addr in broadcast_addresses:
-        s = BroadcastSocket()
-        s.settimeout(timeout)
-        try:
-            s.write(msg, (addr, gdm_group[1]))
-        except socket.error:
-            s.close()
-        else:
-            sockets.append(s)
-
-    server_list = {}
-    for s in sockets:
-        try:
-            for data, server in s.read():
-                response_status, header = data.split('\r\n', 1)
-                headers = email.message_from_string(header)
-                res_id = headers.get('Resource-Identifier')
-                if res_id is not None and res_id not in server_list:
-                    server_info = dict(headers.items())
-                    server_info['Address'] = server[0]
-                    server_list[res_id] = server_info
-        except socket.timeout:
-            pass
-        finally:
-            if hasattr(s, 'leave_group'):
-                s.leave_group(gdm_group[0])
-            s.close()
-
-    return server_list
+        for protocol, res_id, server_info in results:
+            yield (res_id, server_info)
+    finally:
+        results.close()
+
+
+def discover(interface=None, timeout=1.0, cache=None, retries=0, quiet=None,
+             registry=None, duplicates=None, budget=None, stats=None):
+    # answer from the cache while it still holds unexpired servers
+    if cache is not None and len(cache):
+        # the cache may be shared with SSDP
+        server_list = dict((res_id, server_info)
+                           for res_id, server_info in cache.items()
+                           if find_header(server_info,
+                                          'Resource-Identifier') is not None)
+        if server_list:
+            if set(server_list) & getattr(cache, 'warm', set()):
+                # loaded by a PersistentDeviceCache; check they are still
+                # there while the caller gets on with them
+                cache.revalidate(lambda: list(iter_discover(
+                    interface, timeout, cache=cache, retries=retries,
+                    quiet=quiet)), list(server_list))
+            return server_list
+    return dict(iter_discover(interface, timeout, cache=cache,
+                              retries=retries, quiet=quiet,
+                              registry=registry, duplicates=duplicates,
+                              budget=budget, stats=stats))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Lightweight parser for SSDP / GDM response datagrams.
+#
+# discover() only needs the dedup key (USN or Resource-Identifier) of most
+# datagrams, so Headers looks up single fields straight from the raw bytes
+# and only splits the whole header block when every field is asked for.
+
+import re
+
+if bytes is str:
+    def _native(b):
+        return b
+
+    def _bytes(s):
+        return s
+
+    def _buffer(data):
+        # re on Python 2 accepts str, bytearray and buffer, but not
+        # memoryview; recv_batch yields buffers there
+        if isinstance(data, memoryview):
+            return data.tobytes()
+        return data
+else:
+    def _native(b):
+        return b.decode('latin-1')
+
+    def _bytes(s):
+        return s.encode('latin-1')
+
+    def _buffer(data):
+        return data
+
+_line_re = re.compile(br'\n')
+_blank_line_re = re.compile(br'\n\r?\n')
+_header_re = re.compile(br'^([^:\r\n]+?)[ \t]*:[ \t]*(.*?)[ \t]*\r?$', re.M)
+_field_res = {}
+
+
+def find_header(server_info, name):
+    """Return the value of header `name` in `server_info`, a dict of
+    headers such as `discover()` returns, ignoring the case of the name.
+    """
+    name = name.upper()
+    for k, v in server_info.items():
+        if k.upper() == name:
+            return v
+
+
+def _field_re(name):
+    try:
+        return _field_res[name]
+    except KeyError:
+        pattern = (br'^' + re.escape(_bytes(name)) +
+                   br'[ \t]*:[ \t]*(.*?)[ \t]*\r?$')
+        r = _field_res[name] = re.compile(pattern, re.M | re.I)
+        return r
+
+
+class Headers(object):
+
+    __slots__ = ('data', '_start', '_end', '_items', '_fields')
+
+    def __init__(self, data):
+        self.data = _buffer(data)
+        m = _line_re.search(self.data)
+        self._start = m.end() if m is not None else len(self.data)
+        m = _blank_line_re.search(self.data, self._start - 1)
+        self._end = m.start() + 1 if m is not None else len(self.data)
+        self._items = None
+        self._fields = None
+
+    @property
+    def status(self):
+        return _native(bytes(self.data[:self._start])).rstrip('\r\n')
+
+    def _parse(self):
+        items = []
+        fields = {}
+        for m in _header_re.finditer(self.data, self._start, self._end):
+            name, value = _native(m.group(1)), _native(m.group(2))
+            items.append((name, value))
+            # header names are case-folded once, here
+            fields.setdefault(name.lower(), value)
+        self._items = items
+        self._fields = fields
+
+    def get(self, name, default=None):
+        if self._fields is not None:
+            return self._fields.get(name.lower(), default)
+        m = _field_re(name).search(self.data, self._start, self._end)
+        if m is None:
+            return default
+        return _native(m.group(1))
+
+    def items(self):
+        if self._items is None:
+            self._parse()
+        return list(self._items)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        return self.get(name)
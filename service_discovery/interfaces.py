@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# IPv4 network interface enumeration.
+#
+# Uses getifaddrs(3) through ctypes where libc provides it (Linux, BSD,
+# OS X), and falls back to resolving the host name elsewhere.
+
+import collections
+import ctypes
+import ctypes.util
+import socket
+import struct
+import sys
+import threading
+import time
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+IFF_UP = 0x1
+IFF_BROADCAST = 0x2
+IFF_LOOPBACK = 0x8
+IFF_MULTICAST = 0x1000 if sys.platform.startswith('linux') else 0x8000
+
+Interface = collections.namedtuple('Interface',
+                                   'name address netmask flags')
+
+
+class _ifaddrs(ctypes.Structure):
+    pass
+
+
+_ifaddrs._fields_ = [('ifa_next', ctypes.POINTER(_ifaddrs)),
+                     ('ifa_name', ctypes.c_char_p),
+                     ('ifa_flags', ctypes.c_uint),
+                     ('ifa_addr', ctypes.c_void_p),
+                     ('ifa_netmask', ctypes.c_void_p),
+                     ('ifa_broadaddr', ctypes.c_void_p),
+                     ('ifa_data', ctypes.c_void_p)]
+
+
+def _load_libc():
+    if sys.platform.startswith('win'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.getifaddrs.argtypes = [ctypes.POINTER(ctypes.POINTER(_ifaddrs))]
+        libc.freeifaddrs.argtypes = [ctypes.POINTER(_ifaddrs)]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+
+
+def _inet_address(sockaddr):
+    if not sockaddr:
+        return None
+    if sys.platform.startswith('linux'):
+        family = ctypes.c_ushort.from_address(sockaddr).value
+    else:
+        # BSD sockaddr starts with sa_len, then a one byte sa_family
+        family = ctypes.c_ubyte.from_address(sockaddr + 1).value
+    if family != socket.AF_INET:
+        return None
+    # sockaddr_in: family, port, then the address at offset 4
+    return socket.inet_ntoa(ctypes.string_at(sockaddr + 4, 4))
+
+
+def _getifaddrs():
+    ifap = ctypes.POINTER(_ifaddrs)()
+    if _libc.getifaddrs(ctypes.byref(ifap)) != 0:
+        no = ctypes.get_errno()
+        raise OSError(no, 'getifaddrs failed')
+    try:
+        result = []
+        ifa = ifap
+        while ifa:
+            entry = ifa.contents
+            address = _inet_address(entry.ifa_addr)
+            if address is not None:
+                name = entry.ifa_name
+                if not isinstance(name, str):
+                    name = name.decode('utf-8', 'replace')
+                result.append(Interface(name, address,
+                                        _inet_address(entry.ifa_netmask),
+                                        entry.ifa_flags))
+            ifa = entry.ifa_next
+        return result
+    finally:
+        _libc.freeifaddrs(ifap)
+
+
+def _gethostbyname():
+    try:
+        addresses = socket.gethostbyname_ex(socket.gethostname())[2]
+    except socket.error:
+        addresses = []
+    return [Interface(None, address, None, IFF_UP | IFF_MULTICAST |
+                      (IFF_LOOPBACK if address.startswith('127.') else 0))
+            for address in addresses]
+
+
+def get_interfaces():
+    if _libc is not None:
+        try:
+            return _getifaddrs()
+        except OSError:
+            pass
+    return _gethostbyname()
+
+
+def broadcast_address(address, netmask):
+    addr = struct.unpack('!I', socket.inet_aton(address))[0]
+    mask = struct.unpack('!I', socket.inet_aton(netmask))[0]
+    return socket.inet_ntoa(struct.pack('!I', addr | ~mask & 0xffffffff))
+
+
+class InterfaceTable(object):
+    """Cached interface list, re-enumerated at most every `refresh_interval`
+    seconds. Values derived from it are kept until the list actually
+    changes, which bumps `generation`.
+    """
+
+    def __init__(self, refresh_interval=30.0, source=get_interfaces,
+                 clock=time.time):
+        self.refresh_interval = refresh_interval
+        self.source = source
+        self.clock = clock
+        self.generation = 0
+        self._interfaces = None
+        self._refreshed = None
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        interfaces = self.source()
+        with self._lock:
+            self._refreshed = self.clock()
+            if interfaces != self._interfaces:
+                self._interfaces = interfaces
+                self._derived = {}
+                self.generation += 1
+
+    def interfaces(self):
+        if (self._refreshed is None or
+                self.clock() - self._refreshed >= self.refresh_interval):
+            self.refresh()
+        return self._interfaces
+
+    def _cached(self, key, func):
+        interfaces = self.interfaces()
+        derived = self._derived
+        try:
+            return derived[key]
+        except KeyError:
+            value = derived[key] = func(interfaces)
+            return value
+
+    def multicast_addresses(self):
+        """Addresses of the interfaces that are up, can multicast and are
+        not loopback.
+        """
+        def func(interfaces):
+            return [i.address for i in interfaces
+                    if i.flags & IFF_UP and i.flags & IFF_MULTICAST and
+                    not i.flags & IFF_LOOPBACK]
+        return self._cached('multicast', func)
+
+    def broadcast_addresses(self, addresses):
+        """Broadcast destinations for probes sent from local `addresses`:
+        the directed broadcast address of each interface's subnet, plus
+        127.0.0.1 for servers on this host. The limited broadcast address
+        is only used for None or an interface whose netmask is unknown.
+        """
+        def func(interfaces):
+            by_address = dict((i.address, i) for i in interfaces)
+            result = []
+            for address in addresses:
+                i = by_address.get(address)
+                if i is None or i.netmask is None:
+                    addr = '255.255.255.255'
+                elif i.flags & IFF_BROADCAST and i.flags & IFF_UP:
+                    addr = broadcast_address(i.address, i.netmask)
+                else:
+                    continue
+                if addr not in result:
+                    result.append(addr)
+            result.append('127.0.0.1')
+            return result
+        return self._cached(('broadcast', tuple(addresses)), func)
+
+    def broadcast_destination(self, address, addresses):
+        """Which of `broadcast_addresses(addresses)` reaches a server at
+        `address`, None if none does.
+        """
+        destinations = self.broadcast_addresses(addresses)
+        if address.startswith('127.'):
+            return '127.0.0.1'
+        for i in self.interfaces():
+            if i.address in addresses and i.netmask is not None:
+                destination = broadcast_address(i.address, i.netmask)
+                if destination in destinations and \
+                        broadcast_address(address, i.netmask) == destination:
+                    return destination
+        if '255.255.255.255' in destinations:
+            return '255.255.255.255'
+
+
+table = InterfaceTable()
+
+
+def multicast_interfaces():
+    return table.multicast_addresses()
+
+
+def resolve(interface):
+    """Turn the `interface` argument of discover() into a list of local
+    addresses. It may be None for the default interface, one address, a
+    list of addresses or 'all'.
+    """
+    if interface == 'all':
+        return multicast_interfaces() or [None]
+    if interface is None or isinstance(interface, basestring):
+        return [interface]
+    return list(interface)
+
+
+if __name__ == '__main__':
+    for i in get_interfaces():
+        print('%-10s %-15s %-15s %#x' % (i.name, i.address, i.netmask,
+                                         i.flags))
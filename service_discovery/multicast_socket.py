@@ -30,6 +30,8 @@ import os
 import socket
 import struct
 
+from buffer_pool import recv_batch
+
 if os.name in ('nt', 'ce'):
     from errno import (WSAEWOULDBLOCK as EAGAIN,
                        WSAEINTR as EINTR,
@@ -51,9 +53,10 @@ else:
 
 class MulticastSocket(socket.socket):
 
-    max_throughput = 256 * 1024
+    stats = None  # a DiscoveryStats, while one is collecting
 
-    def __init__(self, port=0, interface=None, listen_multiple=False, max_packet_size=8192):
+    def __init__(self, port=0, interface=None, listen_multiple=False,
+                 max_packet_size=8192):
         if interface is None:
             interface = socket.gethostbyname(socket.gethostname())
 
@@ -83,15 +86,21 @@ class MulticastSocket(socket.socket):
         ttl = struct.pack('B', ttl)
         self.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
 
-    def join_group(self, group_address):
+    def join_group(self, group_address, interface=None):
+        if interface is None:
+            interface = self.interface
+
         addr = socket.inet_aton(group_address)
-        interface = socket.inet_aton(self.interface)
+        interface = socket.inet_aton(interface)
         mreq = addr + interface
         self.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
 
-    def leave_group(self, group_address):
+    def leave_group(self, group_address, interface=None):
+        if interface is None:
+            interface = self.interface
+
         addr = socket.inet_aton(group_address)
-        interface = socket.inet_aton(self.interface)
+        interface = socket.inet_aton(interface)
         mreq = addr + interface
         self.setsockopt(socket.IPPROTO_IP, socket.IP_DROP_MEMBERSHIP, mreq)
 
@@ -99,6 +108,8 @@ class MulticastSocket(socket.socket):
         try:
             self.sendto(datagram, addr)
         except socket.error, e:
+            if self.stats is not None:
+                self.stats.send_failed(self, addr)
             no = e.args[0]
             if no == EINTR:
                 return self.write(datagram, addr)
@@ -111,10 +122,16 @@ class MulticastSocket(socket.socket):
                 return
             else:
                 raise
-
-    def read(self):
-        bytes_read = 0
-        while bytes_read < self.max_throughput:
+        else:
+            if self.stats is not None:
+                self.stats.sent(self, len(datagram), addr)
+
+    def read(self, limit=None):
+        stats = self.stats
+        packets_read = 0
+        while limit is None or packets_read < limit:
+            if stats is not None:
+                stats.receive_call(self)
             try:
                 data, addr = self.recvfrom(self.max_packet_size)
             except socket.error, e:
@@ -125,74 +142,22 @@ class MulticastSocket(socket.socket):
                     break
                 raise
             else:
-                bytes_read += len(data)
+                packets_read += 1
+                if stats is not None:
+                    stats.received(self, len(data))
                 yield (data, addr)
 
-
-if __name__ == '__main__':
-    # Plex GDM
-    s = MulticastSocket()
-    s.set_outgoing_interface()
-    s.set_ttl(1)  # multicast will cross router hops if TTL > 1
-    s.settimeout(1.0)
-    s.join_group('239.0.0.250')
-
-    s.write('M-SEARCH * HTTP/1.0', ('239.0.0.250', 32414))
-
-    import email
-    server_list = {}
-    try:
-        for data, server in s.read():
-            response_status, header = data.split('\r\n', 1)
-            headers = email.message_from_string(header)
-            res_id = headers.get('Resource-Identifier')
-            if res_id is not None and res_id not in server_list:
-                server_info = dict(headers.items())
-                server_info['Address'] = server[0]
-                server_list[res_id] = server_info
-    except socket.timeout:
-        pass
-    finally:
-        s.leave_group('239.0.0.250')
-        s.close()
-
-    for server in server_list.values():
-        for k, v in server.iteritems():
-            print k, '=', v
-        print
-
-
-    # SSDP
-    s = MulticastSocket()
-    s.set_outgoing_interface()
-    s.set_ttl(1)  # multicast will cross router hops if TTL > 1
-    s.settimeout(1.0)
-    s.join_group('239.255.255.250')
-    msg = ('M-SEARCH * HTTP/1.1\r\n'
-           'MX: 3\r\n'
-           'ST: upnp:rootdevice\r\n'
-           'HOST: 239.255.255.250:1900\r\n'
-           'MAN: "ssdp:discover"\r\n'
-           '\r\n')
-    s.write(msg, ('239.255.255.250', 1900))
-
-    import email
-    server_list = {}
-    try:
-        for data, server in s.read():
-            response_status, header = data.split('\r\n', 1)
-            headers = email.message_from_string(header)
-            res_id = headers.get('USN')
-            if res_id is not None and res_id not in server_list:
-                server_info = dict(headers.items())
-                server_list[res_id] = server_info
-    except socket.timeout:
-        pass
-    finally:
-        s.leave_group('239.255.255.250')
-        s.close()
-
-    for server in server_list.values():
-        for k, v in server.iteritems():
-            print k, '=', v
-        print
+    def read_into(self, pool, limit=None):
+        stats = self.stats
+        try:
+            for data, addr in recv_batch(self, pool, limit, stats):
+                if stats is not None:
+                    stats.received(self, len(data))
+                yield (data, addr)
+        except socket.error, e:
+            no = e.args[0]
+            if no in _sockErrReadIgnore:
+                return
+            if no in _sockErrReadRefuse:
+                return
+            raise
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from buffer_pool import BufferPool
+from cache import DeviceCache
+from headers import Headers
+from multicast_socket import MulticastSocket
+from receiver import receive
+
+# headers of an ssdp:update that describe the message, not the device
+_update_only = ('HOST', 'NTS', 'NEXTBOOTID.UPNP.ORG')
+
+
+def _merge_update(server_info, update):
+    # an update only carries what changed, and announces the BOOTID the
+    # device uses from now on as NEXTBOOTID
+    merged = dict(server_info.items())
+    names = dict((k.upper(), k) for k in merged)
+    next_bootid = None
+    for k, v in update.items():
+        name = k.upper()
+        if name == 'NEXTBOOTID.UPNP.ORG':
+            next_bootid = v
+        elif name not in _update_only:
+            merged[names.get(name, k)] = v
+    if next_bootid is not None:
+        merged[names.get('BOOTID.UPNP.ORG', 'BOOTID.UPNP.ORG')] = next_bootid
+    return merged
+
+
+class NotifyListener(object):
+    """Keep a registry of SSDP devices from their NOTIFY announcements,
+    without sending any M-SEARCH.
+
+    `ssdp:alive` adds or refreshes a device, `ssdp:update` changes a known
+    one, and `ssdp:byebye` or an expired CACHE-CONTROL max-age removes it.
+    Callbacks subscribed to 'add', 'change' and 'remove' are called with
+    `(usn, server_info)` from the listening thread. A `DeviceRegistry`, if
+    given, is kept in sync as well.
+    """
+
+    ssdp_group = ('239.255.255.250', 1900)
+    events = ('add', 'change', 'remove')
+
+    def __init__(self, interface=None, tick=1.0, cache=None, registry=None):
+        self.interface = interface
+        self.tick = tick
+        self.cache = cache if cache is not None else DeviceCache()
+        self.registry = registry
+        self.socket = None
+        self._callbacks = dict((event, []) for event in self.events)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def subscribe(self, event, callback):
+        self._callbacks[event].append(callback)
+
+    def unsubscribe(self, event, callback):
+        self._callbacks[event].remove(callback)
+
+    def _emit(self, event, usn, server_info):
+        for callback in list(self._callbacks[event]):
+            callback(usn, server_info)
+
+    def devices(self):
+        with self._lock:
+            return dict(self.cache.items())
+
+    def open(self):
+        # bind to every address, since multicast datagrams are not delivered
+        # to a socket bound to a unicast address, and join on `interface`
+        s = MulticastSocket(port=self.ssdp_group[1], interface='0.0.0.0',
+                            listen_multiple=True)
+        s.join_group(self.ssdp_group[0], self.interface or '0.0.0.0')
+        self.socket = s
+
+    def close(self):
+        if self.socket is not None:
+            try:
+                self.socket.leave_group(self.ssdp_group[0],
+                                        self.interface or '0.0.0.0')
+            finally:
+                self.socket.close()
+                self.socket = None
+
+    def handle(self, data, addr):
+        headers = Headers(data)
+        if not headers.status.startswith('NOTIFY '):
+            return
+        usn = headers.get('USN')
+        nts = headers.get('NTS')
+        if usn is None or nts is None:
+            return
+
+        events = []
+        with self._lock:
+            known = self.cache.get(usn)
+            if nts == 'ssdp:byebye':
+                if known is not None:
+                    self.cache.remove(usn)
+                    events.append(('remove', known))
+            else:
+                server_info = dict(headers.items())
+                server_info.pop('NTS', None)
+                if nts == 'ssdp:alive':
+                    self.cache.add(usn, server_info)
+                    if known is None:
+                        events.append(('add', server_info))
+                    elif known != server_info:
+                        events.append(('change', server_info))
+                elif nts == 'ssdp:update' and known is not None:
+                    server_info = _merge_update(known, server_info)
+                    self.cache.update(usn, server_info)
+                    events.append(('change', server_info))
+
+        for event, server_info in events:
+            if self.registry is not None:
+                if event == 'remove':
+                    self.registry.remove(usn)
+                else:
+                    self.registry.add(usn, server_info, addr[0])
+            self._emit(event, usn, server_info)
+
+    def expire(self):
+        with self._lock:
+            expired = self.cache.expire()
+        for usn, server_info in expired:
+            if self.registry is not None:
+                self.registry.remove(usn)
+            self._emit('remove', usn, server_info)
+
+    def run(self):
+        if self.socket is None:
+            self.open()
+        pool = BufferPool()
+        try:
+            while not self._stopped.is_set():
+                for s, data, addr in receive([self.socket], self.tick, pool):
+                    self.handle(data, addr)
+                self.expire()
+        finally:
+            self.close()
+
+    def start(self):
+        self._stopped.clear()
+        self.open()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == '__main__':
+    import time
+
+    def printer(event):
+        def callback(usn, server_info):
+            print('%s %s %s' % (event, usn, server_info.get('LOCATION', '')))
+        return callback
+
+    listener = NotifyListener()
+    for event in listener.events:
+        listener.subscribe(event, printer(event))
+    listener.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        listener.stop()
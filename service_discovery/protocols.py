@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Discovery protocol descriptors.
+#
+# A descriptor tells the discovery engine where to send its probes, what to
+# send, how to recognise and deduplicate responses, and how to turn a
+# response into a server record. Several descriptors can share the sockets
+# and the deadline of one scan.
+
+try:
+    basestring
+except NameError:
+    basestring = str
+
+
+def search_targets(st):
+    # one search target, or several
+    if isinstance(st, basestring):
+        return [st]
+    return list(st)
+
+
+class Protocol(object):
+
+    name = None
+    group = None  # multicast (address, port); the port is also broadcast to
+    key = None    # header that identifies a server
+    mx = None     # seconds responders may wait before answering
+
+    def probes(self):
+        raise NotImplementedError
+
+    def response_key(self, headers):
+        return headers.get(self.key)
+
+    def record(self, headers, addr):
+        return dict(headers.items())
+
+
+class SSDP(Protocol):
+
+    name = 'ssdp'
+    group = ('239.255.255.250', 1900)
+    key = 'USN'
+
+    _messages = {}
+
+    def __init__(self, st='upnp:rootdevice', mx=3):
+        # one or several search targets, probed together
+        self.st = search_targets(st)
+        self.mx = mx
+        self._probes = [self.message(target) for target in self.st]
+
+    def message(self, st):
+        key = (st, self.mx)
+        try:
+            return self._messages[key]
+        except KeyError:
+            msg = ('M-SEARCH * HTTP/1.1\r\n'
+                   'MX: %d\r\n'
+                   'ST: %s\r\n'
+                   'HOST: %s:%s\r\n'
+                   'MAN: "ssdp:discover"\r\n'
+                   '\r\n' % ((self.mx, st) + self.group)).encode('ascii')
+            self._messages[key] = msg
+            return msg
+
+    def probes(self):
+        return self._probes
+
+
+class GDM(Protocol):
+
+    name = 'gdm'
+    group = ('239.0.0.250', 32414)
+    key = 'Resource-Identifier'
+
+    _probes = [b'M-SEARCH * HTTP/1.0']
+
+    def probes(self):
+        return self._probes
+
+    def record(self, headers, addr):
+        server_info = dict(headers.items())
+        server_info['Address'] = addr[0]
+        return server_info
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import select
+import time
+
+if os.name in ('nt', 'ce'):
+    from errno import WSAEINTR as EINTR
+else:
+    from errno import EINTR
+
+
+class ReadBudget(object):
+    """How much `receive()` reads each time `select()` wakes it up.
+
+    Up to `max_bytes` (the last datagram may cross it) and `max_packets`
+    are read per wake-up, split fairly across the readable sockets: they
+    are read in rounds, each socket taking the same number of datagrams
+    per round and at most an equal share of the bytes left, until every
+    socket is drained or the budget is spent. A socket flooded with
+    responses thus cannot starve the others, and the time spent between
+    two `select()` calls stays bounded.
+
+    Nothing is dropped by the budget. Datagrams left on a socket stay
+    queued for the next wake-up, which is counted in `deferred`, and
+    `behind` holds the sockets the last wake-up left datagrams on. A scan
+    that has to end while sockets are behind counts them in `truncated`.
+    """
+
+    turn = 32  # most datagrams read from one socket per round
+
+    def __init__(self, max_bytes=256 * 1024, max_packets=None):
+        self.max_bytes = max_bytes
+        self.max_packets = max_packets
+        self.ticks = 0
+        self.deferred = 0
+        self.truncated = 0
+        self.behind = []
+
+
+def _read_fairly(readable, budget, pool):
+    active = list(readable)
+    bytes_left = budget.max_bytes
+    packets_left = budget.max_packets
+    while active and bytes_left > 0 and \
+            (packets_left is None or packets_left > 0):
+        turn = budget.turn
+        if packets_left is not None:
+            turn = max(1, min(turn, packets_left // len(active)))
+        share = max(1, bytes_left // len(active))
+        for s in list(active):
+            if bytes_left <= 0:
+                break
+            limit = turn
+            if pool is None:
+                datagrams = s.read(limit)
+            else:
+                # a whole batch is taken off the socket at once, so never
+                # ask for more datagrams than the share can hold
+                limit = max(1, min(turn, share // pool.size))
+                datagrams = s.read_into(pool, limit)
+            n = 0
+            spent = 0
+            for data, addr in datagrams:
+                n += 1
+                spent += len(data)
+                bytes_left -= len(data)
+                yield (s, data, addr)
+                if spent >= share or bytes_left <= 0:
+                    break
+            if packets_left is not None:
+                packets_left -= n
+            if n < limit and spent < share and bytes_left > 0:
+                # drained
+                active.remove(s)
+    budget.behind = active
+    budget.deferred += len(active)
+
+
+def receive(sockets, timeout, pool=None, budget=None):
+    """Wait on all `sockets` at once and yield `(socket, data, addr)` for
+    every datagram received before `timeout` seconds have elapsed.
+
+    The sockets must be non-blocking and provide `read()` and `read_into()`
+    generators, as `MulticastSocket` and `BroadcastSocket` do. With a
+    `BufferPool`, `data` is a memoryview (a buffer on Python 2) into the
+    pool that is only valid until the next datagram is yielded. How much is
+    read per wake-up is governed by a `ReadBudget`.
+    """
+    if budget is None:
+        budget = ReadBudget()
+    sockets = list(sockets)
+    deadline = time.time() + timeout
+    budget.behind = []
+
+    while sockets:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+
+        try:
+            readable, _, _ = select.select(sockets, [], [], remaining)
+        except (select.error, OSError) as e:
+            if e.args[0] == EINTR:
+                continue
+            raise
+
+        budget.ticks += 1
+        for item in _read_fairly(readable, budget, pool):
+            yield item
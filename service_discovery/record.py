@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Memory-compact server records.
+#
+# A record built with dict(headers.items()) holds its own dict, hash table
+# and key strings. DeviceRecord keeps the well-known headers in __slots__,
+# interns header names and the values that repeat across a fleet (ST,
+# SERVER, CACHE-CONTROL, ...), and packs every other header into a single
+# tuple that is only scanned when one of them is asked for.
+
+import sys
+
+try:
+    intern = sys.intern
+except AttributeError:
+    pass
+
+# header name -> slot, for the fields every record is likely to have
+_FIELDS = (
+    ('USN', 'usn'),
+    ('ST', 'st'),
+    ('NT', 'nt'),
+    ('LOCATION', 'location'),
+    ('SERVER', 'server'),
+    ('CACHE-CONTROL', 'cache_control'),
+    ('Resource-Identifier', 'resource_identifier'),
+    ('Address', 'address'),
+)
+_SLOTS = dict((name.upper(), slot) for name, slot in _FIELDS)
+_INTERNED_SLOTS = ('st', 'nt', 'server', 'cache_control', 'address')
+# values up to this length are interned, longer ones are likely unique
+_INTERN_MAX = 64
+
+
+class DeviceRecord(object):
+    """Read-only mapping of the headers of one discovered server.
+
+    Header names are case-insensitive. The well-known ones are also
+    available as attributes, e.g. `record.location`.
+    """
+
+    __slots__ = tuple(slot for name, slot in _FIELDS) + ('_extra',)
+
+    def __init__(self, server_info):
+        for name, slot in _FIELDS:
+            object.__setattr__(self, slot, None)
+        extra = []
+        for name, value in server_info.items():
+            slot = _SLOTS.get(name.upper())
+            if slot is not None:
+                if slot in _INTERNED_SLOTS:
+                    value = intern(value)
+                object.__setattr__(self, slot, value)
+            else:
+                if len(value) <= _INTERN_MAX:
+                    value = intern(value)
+                extra.append((intern(name), value))
+        object.__setattr__(self, '_extra', tuple(extra) or None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('DeviceRecord is read-only')
+
+    def items(self):
+        items = [(name, getattr(self, slot)) for name, slot in _FIELDS
+                 if getattr(self, slot) is not None]
+        if self._extra is not None:
+            items.extend(self._extra)
+        return items
+
+    iteritems = items
+
+    def keys(self):
+        return [name for name, value in self.items()]
+
+    def values(self):
+        return [value for name, value in self.items()]
+
+    def get(self, name, default=None):
+        slot = _SLOTS.get(name.upper())
+        if slot is not None:
+            value = getattr(self, slot)
+            return default if value is None else value
+        if self._extra is not None:
+            name = name.upper()
+            for k, v in self._extra:
+                if k.upper() == name:
+                    return v
+        return default
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, DeviceRecord):
+            other = other.items()
+        elif isinstance(other, dict):
+            other = [(k.upper(), v) for k, v in other.items()]
+        else:
+            return NotImplemented
+        return (sorted((k.upper(), v) for k, v in self.items()) ==
+                sorted((k.upper(), v) for k, v in other))
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'DeviceRecord(%r)' % dict(self.items())
+
+    def to_dict(self):
+        return dict(self.items())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+import socket
+import struct
+import threading
+
+try:
+    from headers import find_header
+    from record import DeviceRecord
+except ImportError:  # Python 3
+    from .headers import find_header
+    from .record import DeviceRecord
+
+
+def _uuid(key):
+    # USN is "uuid:<device-UUID>[::<type>]"; GDM identifiers are bare
+    if key.startswith('uuid:'):
+        key = key[5:]
+    return key.split('::', 1)[0]
+
+
+def _address_value(address):
+    return struct.unpack('!I', socket.inet_aton(address))[0]
+
+
+def _subnet_range(subnet):
+    network, _, prefix = subnet.partition('/')
+    prefix = int(prefix) if prefix else 32
+    mask = (0xffffffff << (32 - prefix)) & 0xffffffff
+    low = _address_value(network) & mask
+    return low, low | (~mask & 0xffffffff)
+
+
+class _SortedIndex(object):
+    # sorted keys with bisect for range and prefix lookups
+
+    def __init__(self):
+        self.keys = []
+        self.values = {}
+
+    def add(self, key, value):
+        values = self.values.get(key)
+        if values is None:
+            values = self.values[key] = set()
+            bisect.insort(self.keys, key)
+        values.add(value)
+
+    def discard(self, key, value):
+        values = self.values.get(key)
+        if values is None:
+            return
+        values.discard(value)
+        if not values:
+            del self.values[key]
+            del self.keys[bisect.bisect_left(self.keys, key)]
+
+    def range(self, low, high):
+        result = set()
+        i = bisect.bisect_left(self.keys, low)
+        j = bisect.bisect_right(self.keys, high)
+        for key in self.keys[i:j]:
+            result.update(self.values[key])
+        return result
+
+    def prefix(self, prefix):
+        result = set()
+        i = bisect.bisect_left(self.keys, prefix)
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            result.update(self.values[self.keys[i]])
+            i += 1
+        return result
+
+
+def _index_add(index, key, value):
+    index.setdefault(key, set()).add(value)
+
+
+def _index_discard(index, key, value):
+    values = index.get(key)
+    if values is not None:
+        values.discard(value)
+        if not values:
+            del index[key]
+
+
+class DeviceRegistry(object):
+    """Discovered devices with secondary indexes.
+
+    Devices are looked up by ST/NT and SERVER string in O(1), and by UUID
+    prefix and source subnet in O(log n) plus the number of matches.
+    `query()` intersects several criteria, starting from the smallest.
+
+    With `compact`, devices are stored as `DeviceRecord`s instead of the
+    dicts they were discovered as.
+    """
+
+    def __init__(self, compact=True):
+        self.compact = compact
+        self._devices = {}
+        self._fields = {}
+        self._by_type = {}
+        self._by_server = {}
+        self._by_uuid = _SortedIndex()
+        self._by_address = _SortedIndex()
+        self._lock = threading.Lock()
+
+    def add(self, key, server_info, address=None):
+        if address is None:
+            address = server_info.get('Address')
+        if self.compact and not isinstance(server_info, DeviceRecord):
+            server_info = DeviceRecord(server_info)
+        fields = (find_header(server_info, 'ST') or
+                  find_header(server_info, 'NT'),
+                  find_header(server_info, 'SERVER'),
+                  _uuid(key),
+                  _address_value(address) if address else None)
+        with self._lock:
+            if key in self._devices:
+                self._unindex(key)
+            self._devices[key] = server_info
+            self._fields[key] = fields
+            device_type, server, uuid, address = fields
+            if device_type is not None:
+                _index_add(self._by_type, device_type, key)
+            if server is not None:
+                _index_add(self._by_server, server, key)
+            self._by_uuid.add(uuid, key)
+            if address is not None:
+                self._by_address.add(address, key)
+
+    def _unindex(self, key):
+        device_type, server, uuid, address = self._fields.pop(key)
+        if device_type is not None:
+            _index_discard(self._by_type, device_type, key)
+        if server is not None:
+            _index_discard(self._by_server, server, key)
+        self._by_uuid.discard(uuid, key)
+        if address is not None:
+            self._by_address.discard(address, key)
+
+    def remove(self, key):
+        with self._lock:
+            if self._devices.pop(key, None) is not None:
+                self._unindex(key)
+
+    def get(self, key, default=None):
+        return self._devices.get(key, default)
+
+    def __contains__(self, key):
+        return key in self._devices
+
+    def __len__(self):
+        return len(self._devices)
+
+    def _keys(self, type=None, uuid_prefix=None, subnet=None, server=None):
+        candidates = []
+        if type is not None:
+            candidates.append(self._by_type.get(type, set()))
+        if server is not None:
+            candidates.append(self._by_server.get(server, set()))
+        if uuid_prefix is not None:
+            candidates.append(self._by_uuid.prefix(_uuid(uuid_prefix)))
+        if subnet is not None:
+            candidates.append(self._by_address.range(*_subnet_range(subnet)))
+        if not candidates:
+            return set(self._devices)
+        candidates.sort(key=len)
+        keys = set(candidates[0])
+        for other in candidates[1:]:
+            keys.intersection_update(other)
+        return keys
+
+    def query(self, type=None, uuid_prefix=None, subnet=None, server=None):
+        """Return `{key: server_info}` of the devices matching every given
+        criterion. `subnet` is in CIDR notation, e.g. '10.1.2.0/24'.
+        """
+        with self._lock:
+            keys = self._keys(type, uuid_prefix, subnet, server)
+            return dict((key, self._devices[key]) for key in keys)
+
+    def by_type(self, type):
+        return self.query(type=type)
+
+    def by_server(self, server):
+        return self.query(server=server)
+
+    def by_uuid_prefix(self, prefix):
+        return self.query(uuid_prefix=prefix)
+
+    def by_subnet(self, subnet):
+        return self.query(subnet=subnet)
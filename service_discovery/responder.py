@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import OrderedDict
+
+from buffer_pool import BufferPool
+from headers import Headers
+from multicast_socket import MulticastSocket
+from receiver import receive
+
+
+class Responder(object):
+    """Answer SSDP and GDM M-SEARCHes for the services added to it, and
+    announce the SSDP ones with periodic NOTIFYs.
+
+    Every response and announcement is rendered once, when its service is
+    added, so answering a search is a lookup and a `sendto()`. Each
+    requesting host may receive the responses of at most `rate` searches
+    per second, with bursts of up to `rate` searches; the others are
+    dropped.
+
+    Responses are sent right away instead of at a random point of the MX
+    window, since the responder is meant for test rigs and small edge nodes
+    rather than crowded networks.
+    """
+
+    ssdp_group = ('239.255.255.250', 1900)
+    gdm_group = ('239.0.0.250', 32414)
+
+    # forget the rate of requesters beyond this many
+    max_requesters = 4096
+    # never announce more often than this, whatever max-age is
+    min_notify_interval = 1.0
+
+    def __init__(self, interface=None, rate=10, notify_interval=None,
+                 tick=1.0, clock=time.time):
+        self.interface = interface
+        self.rate = rate
+        self.notify_interval = notify_interval
+        self.tick = tick
+        self.clock = clock
+        self.ssdp_socket = None
+        self.gdm_socket = None
+        self._responses = {}  # ST -> [response]
+        self._gdm_responses = []
+        self._alive = []
+        self._byebye = []
+        self._requesters = OrderedDict()  # host -> (tokens, time)
+        self._next_notify = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def add_ssdp(self, uuid, device_type, location, server,
+                 services=(), max_age=1800, bootid=None):
+        """Answer for a root device `uuid:<uuid>` of type `device_type`,
+        described at `location`, that provides `services` (service types
+        such as 'urn:schemas-upnp-org:service:ContentDirectory:1').
+        """
+        udn = 'uuid:%s' % uuid
+        targets = [('upnp:rootdevice', '%s::upnp:rootdevice' % udn),
+                   (udn, udn),
+                   (device_type, '%s::%s' % (udn, device_type))]
+        targets.extend((service, '%s::%s' % (udn, service))
+                       for service in services)
+
+        common = ['CACHE-CONTROL: max-age=%d' % max_age,
+                  'LOCATION: %s' % location,
+                  'SERVER: %s' % server]
+        if bootid is not None:
+            common.append('BOOTID.UPNP.ORG: %d' % bootid)
+        host = 'HOST: %s:%d' % self.ssdp_group
+
+        for target, usn in targets:
+            response = ['HTTP/1.1 200 OK', 'EXT:'] + common + [
+                'ST: %s' % target, 'USN: %s' % usn]
+            self._render(self._responses.setdefault(target, []), response)
+            self._render(self._responses.setdefault('ssdp:all', []),
+                         response)
+            self._render(self._alive, ['NOTIFY * HTTP/1.1', host] + common + [
+                'NT: %s' % target, 'NTS: ssdp:alive', 'USN: %s' % usn])
+            self._render(self._byebye, ['NOTIFY * HTTP/1.1', host,
+                                        'NT: %s' % target,
+                                        'NTS: ssdp:byebye',
+                                        'USN: %s' % usn])
+
+        # announce well within max-age, as UPnP asks
+        interval = max_age / 3.0
+        if self.notify_interval is not None:
+            interval = min(self.notify_interval, interval)
+        self.notify_interval = max(interval, self.min_notify_interval)
+        self._next_notify = 0
+
+    def add_gdm(self, resource_identifier, name, port, headers=None):
+        """Answer GDM searches for a server `resource_identifier` named
+        `name` and listening on `port`. `headers` are additional response
+        headers, e.g. {'Content-Type': 'plex/media-server'}.
+        """
+        response = ['HTTP/1.0 200 OK',
+                    'Resource-Identifier: %s' % resource_identifier,
+                    'Name: %s' % name,
+                    'Port: %d' % port]
+        for k, v in sorted((headers or {}).items()):
+            response.append('%s: %s' % (k, v))
+        self._render(self._gdm_responses, response)
+
+    def _render(self, messages, lines):
+        messages.append(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    def _allow(self, host):
+        # token bucket per requesting host
+        now = self.clock()
+        tokens, last = self._requesters.get(host, (self.rate, now))
+        tokens = min(self.rate, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            return False
+        if host in self._requesters:
+            # keep the hosts in the order they were last answered
+            del self._requesters[host]
+        elif len(self._requesters) >= self.max_requesters:
+            # forget the one answered longest ago, whose bucket has most
+            # likely filled up again anyway
+            self._requesters.popitem(last=False)
+        self._requesters[host] = (tokens - 1, now)
+        return True
+
+    def handle_ssdp(self, data, addr):
+        headers = Headers(data)
+        if not headers.status.startswith('M-SEARCH '):
+            return
+        responses = self._responses.get(headers.get('ST'))
+        if not responses or 'ssdp:discover' not in headers.get('MAN', ''):
+            return
+        if not self._allow(addr[0]):
+            return
+        for response in responses:
+            self.ssdp_socket.write(response, addr)
+
+    def handle_gdm(self, data, addr):
+        if not self._gdm_responses or \
+                not Headers(data).status.startswith('M-SEARCH '):
+            return
+        if not self._allow(addr[0]):
+            return
+        for response in self._gdm_responses:
+            self.gdm_socket.write(response, addr)
+
+    def notify(self, messages=None):
+        if self.ssdp_socket is None:
+            return
+        for message in self._alive if messages is None else messages:
+            self.ssdp_socket.write(message, self.ssdp_group)
+
+    def open(self):
+        # bind to every address, since multicast datagrams are not delivered
+        # to a socket bound to a unicast address, and join on `interface`
+        interface = self.interface or '0.0.0.0'
+        if self._responses:
+            s = MulticastSocket(port=self.ssdp_group[1], interface='0.0.0.0',
+                                listen_multiple=True)
+            s.join_group(self.ssdp_group[0], interface)
+            if self.interface is not None:
+                s.set_outgoing_interface(self.interface)
+            s.set_ttl(2)  # as UPnP recommends for announcements
+            self.ssdp_socket = s
+        if self._gdm_responses:
+            s = MulticastSocket(port=self.gdm_group[1], interface='0.0.0.0',
+                                listen_multiple=True)
+            s.join_group(self.gdm_group[0], interface)
+            self.gdm_socket = s
+
+    def close(self):
+        interface = self.interface or '0.0.0.0'
+        for s, group in ((self.ssdp_socket, self.ssdp_group),
+                         (self.gdm_socket, self.gdm_group)):
+            if s is not None:
+                try:
+                    s.leave_group(group[0], interface)
+                finally:
+                    s.close()
+        self.ssdp_socket = self.gdm_socket = None
+
+    def run(self):
+        if self.ssdp_socket is None and self.gdm_socket is None:
+            self.open()
+        sockets = [s for s in (self.ssdp_socket, self.gdm_socket)
+                   if s is not None]
+        pool = BufferPool()
+        try:
+            while not self._stopped.is_set():
+                if self._alive and self.clock() >= self._next_notify:
+                    self.notify()
+                    self._next_notify = self.clock() + self.notify_interval
+                for s, data, addr in receive(sockets, self.tick, pool):
+                    if s is self.gdm_socket:
+                        self.handle_gdm(data, addr)
+                    else:
+                        self.handle_ssdp(data, addr)
+            self.notify(self._byebye)
+        finally:
+            self.close()
+
+    def start(self):
+        self._stopped.clear()
+        self.open()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == '__main__':
+    import socket
+    import uuid
+
+    hostname = socket.gethostname()
+    responder = Responder()
+    responder.add_ssdp(uuid.uuid4(), 'urn:schemas-upnp-org:device:Basic:1',
+                       'http://%s/description.xml' % hostname,
+                       'Python/2 UPnP/1.1 service_discovery/0.1')
+    responder.add_gdm(uuid.uuid4(), hostname, 32400)
+    responder.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        responder.stop()
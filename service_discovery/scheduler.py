@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+
+
+class ProbeScheduler(object):
+    """When to send the initial probe and its retransmissions.
+
+    The initial probe goes out at once. The `window`, normally the largest
+    MX of the protocols being probed, is split into `retries + 1` equal
+    slots and each retransmission is sent at a random point of its own
+    slot, so lost probes get another chance without every host on the
+    LAN retransmitting in lockstep.
+    """
+
+    def __init__(self, retries=0, window=1.0, random=random.random):
+        self.retries = retries
+        self.window = window
+        self.random = random
+
+    def times(self):
+        slot = float(self.window) / (self.retries + 1)
+        return [0.0] + [slot * (i + self.random())
+                        for i in range(1, self.retries + 1)]
+
+
+def mx_window(protocols, timeout):
+    mxs = [protocol.mx for protocol in protocols
+           if getattr(protocol, 'mx', None)]
+    if not mxs:
+        return timeout
+    return min(timeout, max(mxs))
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Device table in shared memory.
+#
+# One process publishes the discovered devices into a memory-mapped file,
+# any number of processes map the same file and read it in place. The file
+# holds a fixed header, an open addressing hash index of the keys and
+# fixed-size records:
+#
+#   header   magic, layout, sequence, version, capacity, record size,
+#            index slots, device count, superseded
+#   index    `slots` little-endian u32, record number + 1 or 0 when empty
+#   records  `capacity` times: u16 key length, u16 data length, key, data
+#
+# Record data are the server's headers as 'Name: value\r\n' lines. Readers
+# check consistency seqlock style: the writer makes `sequence` odd while it
+# rewrites the table and even again afterwards, and a reader retries
+# whenever `sequence` was odd or changed while it was reading.
+#
+# A table is created aside and renamed over `path`, never rewritten in
+# place, so that a process still mapping the previous file keeps reading
+# valid memory. The new table carries on from the version of the one it
+# replaces, which is then flagged `superseded`: readers only look for the
+# new file by its inode once they see that flag, not on every read.
+#
+# Readers decode a record once per table version, into a DeviceRecord
+# shared by every lookup of the same key until the table is published
+# again.
+
+import mmap
+import os
+import struct
+import time
+import zlib
+
+try:
+    from record import DeviceRecord
+except ImportError:  # Python 3
+    from .record import DeviceRecord
+
+_MAGIC = b'SDTB'
+_LAYOUT = 1
+_HEADER = struct.Struct('<4sIQQIIII')
+_SEQUENCE = struct.Struct('<Q')
+_SEQUENCE_OFFSET = 8
+_VERSION = struct.Struct('<Q')
+_VERSION_OFFSET = 16
+_SUPERSEDED = struct.Struct('<I')
+_SUPERSEDED_OFFSET = _HEADER.size
+_SLOT = struct.Struct('<I')
+_RECORD = struct.Struct('<HH')
+_HEADER_SIZE = 64
+
+
+class _Torn(Exception):
+    # the table changed while it was being read
+    pass
+
+
+def _hash(key):
+    return zlib.crc32(key) & 0xffffffff
+
+
+def _bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('latin-1')
+
+
+def _native(data):
+    if str is bytes:
+        return data
+    return data.decode('latin-1')
+
+
+def _encode(server_info):
+    return _bytes(''.join('%s: %s\r\n' % item
+                          for item in server_info.items()))
+
+
+def _decode(data):
+    server_info = {}
+    for line in _native(data).split('\r\n'):
+        if line:
+            name, _, value = line.partition(': ')
+            server_info[name] = value
+    return server_info
+
+
+def _map_readonly(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        buf = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        return buf, os.fstat(fd).st_ino
+    finally:
+        os.close(fd)
+
+
+def _map_previous(path):
+    # map the table at `path` about to be replaced, or return None
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except OSError:
+        return None
+    try:
+        buf = mmap.mmap(fd, 0)
+    except (EnvironmentError, ValueError):
+        return None
+    finally:
+        os.close(fd)
+    if len(buf) < _HEADER_SIZE or \
+            _HEADER.unpack_from(buf, 0)[:2] != (_MAGIC, _LAYOUT):
+        buf.close()
+        return None
+    return buf
+
+
+class SharedDeviceTable(object):
+    """Devices keyed by USN / Resource-Identifier in a memory-mapped file.
+
+    Create the table with `create()` in the process that discovers, and
+    `publish()` each new device set to it; open it with `open()` anywhere
+    else and read it like a read-only mapping. Devices whose headers do not
+    fit in `record_size` bytes, or beyond `capacity`, are left out and
+    counted in `dropped`.
+
+    Readers wait for a write in progress for up to `timeout` seconds.
+    `create()` on an existing table replaces it, carrying its version on,
+    and readers that have it open move to the new one on their next read.
+    Lookups return read-only `DeviceRecord`s.
+    """
+
+    timeout = 1.0
+
+    def __init__(self, path, buf, inode=None):
+        self.path = path
+        self.dropped = 0
+        self._map = None
+        self._map_table(buf, inode)
+
+    def _map_table(self, buf, inode):
+        (magic, layout, _, _, capacity, record_size,
+         slots, _) = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or layout != _LAYOUT:
+            raise ValueError('%s is not a device table' % self.path)
+        if self._map is not None:
+            self._map.close()
+        self._map = buf
+        self._inode = inode
+        # key -> (record number, DeviceRecord) decoded at _cache_version
+        self._cache = {}
+        self._cache_version = None
+        self.capacity = capacity
+        self.record_size = record_size
+        self.slots = slots
+        self._records = _HEADER_SIZE + slots * _SLOT.size
+
+    @classmethod
+    def create(cls, path, capacity=1024, record_size=1024):
+        slots = 1
+        while slots < capacity * 2:
+            slots *= 2
+        size = _HEADER_SIZE + slots * _SLOT.size + capacity * record_size
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            buf = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        previous = _map_previous(path)
+        version = 0
+        if previous is not None:
+            version = _VERSION.unpack_from(previous, _VERSION_OFFSET)[0] + 1
+        _HEADER.pack_into(buf, 0, _MAGIC, _LAYOUT, 0, version, capacity,
+                          record_size, slots, 0)
+        os.rename(tmp, path)
+        if previous is not None:
+            # only once the new file is in place, so that readers seeing
+            # the flag find it
+            _SUPERSEDED.pack_into(previous, _SUPERSEDED_OFFSET, 1)
+            previous.close()
+        return cls(path, buf)
+
+    @classmethod
+    def open(cls, path):
+        buf, inode = _map_readonly(path)
+        return cls(path, buf, inode)
+
+    def _remap(self):
+        # the table was created again; switch to the new file. The old
+        # mapping stays readable until it is closed, so this only needs
+        # doing between reads.
+        try:
+            inode = os.stat(self.path).st_ino
+        except OSError:
+            return
+        if inode != self._inode:
+            self._map_table(*_map_readonly(self.path))
+
+    def close(self):
+        self._map.close()
+
+    # writer
+
+    def publish(self, devices):
+        """Replace the content of the table with `devices`, an iterable of
+        `(key, server_info)`.
+        """
+        index = [0] * self.slots
+        records = []
+        dropped = 0
+        for key, server_info in devices:
+            key = _bytes(key)
+            data = _encode(server_info)
+            if (len(records) == self.capacity or
+                    _RECORD.size + len(key) + len(data) > self.record_size):
+                dropped += 1
+                continue
+            slot = _hash(key) & (self.slots - 1)
+            while index[slot]:
+                slot = (slot + 1) & (self.slots - 1)
+            records.append(_RECORD.pack(len(key), len(data)) + key + data)
+            index[slot] = len(records)
+
+        buf = self._map
+        sequence = _SEQUENCE.unpack_from(buf, _SEQUENCE_OFFSET)[0]
+        version = _VERSION.unpack_from(buf, _VERSION_OFFSET)[0]
+        _SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, sequence + 1)
+        buf[_HEADER_SIZE:self._records] = struct.pack(
+            '<%dI' % self.slots, *index)
+        for i, record in enumerate(records):
+            offset = self._records + i * self.record_size
+            buf[offset:offset + len(record)] = record
+        _HEADER.pack_into(buf, 0, _MAGIC, _LAYOUT, sequence + 1,
+                          version + 1, self.capacity, self.record_size,
+                          self.slots, len(records))
+        _SEQUENCE.pack_into(buf, _SEQUENCE_OFFSET, sequence + 2)
+        self.dropped = dropped
+
+    # readers
+
+    def _consistent(self, read):
+        if self._inode is not None and \
+                _SUPERSEDED.unpack_from(self._map, _SUPERSEDED_OFFSET)[0]:
+            self._remap()
+        buf = self._map
+        deadline = None
+        while True:
+            before = _SEQUENCE.unpack_from(buf, _SEQUENCE_OFFSET)[0]
+            if before & 1:
+                # a write is in progress, or the writer died during one
+                if deadline is None:
+                    deadline = time.time() + self.timeout
+                elif time.time() > deadline:
+                    raise IOError('%s is being written for too long' %
+                                  self.path)
+                time.sleep(0)
+                continue
+            try:
+                result = read(buf)
+            except (_Torn, struct.error, ValueError, UnicodeDecodeError):
+                result = _Torn
+            if _SEQUENCE.unpack_from(buf, _SEQUENCE_OFFSET)[0] == before \
+                    and result is not _Torn:
+                return result
+
+    def _offset(self, buf, n):
+        # offset and lengths of the key and data of record `n`
+        offset = self._records + (n - 1) * self.record_size
+        key_length, data_length = _RECORD.unpack_from(buf, offset)
+        if _RECORD.size + key_length + data_length > self.record_size:
+            raise _Torn()
+        return offset + _RECORD.size, key_length, data_length
+
+    def _cached(self, version, key):
+        # the record number and DeviceRecord of `key` decoded from version
+        # `version`, or None
+        if version != self._cache_version:
+            return None
+        return self._cache.get(key)
+
+    def _decoded(self, buf, version, n, key=None):
+        # the key and the DeviceRecord, if cached, else server_info, of
+        # record `n`
+        offset, key_length, data_length = self._offset(buf, n)
+        if key is None:
+            key = buf[offset:offset + key_length]
+        key = _native(key)
+        cached = self._cached(version, key)
+        if cached is not None and cached[0] == n:
+            return key, cached[1]
+        offset += key_length
+        return key, _decode(buf[offset:offset + data_length])
+
+    def _get(self, buf, key):
+        version = _VERSION.unpack_from(buf, _VERSION_OFFSET)[0]
+        slot = _hash(key) & (self.slots - 1)
+        for i in range(self.slots):
+            n = _SLOT.unpack_from(buf, _HEADER_SIZE + slot * _SLOT.size)[0]
+            if not n:
+                break
+            if n > self.capacity:
+                raise _Torn()
+            offset, key_length, data_length = self._offset(buf, n)
+            if key_length == len(key) and \
+                    buf[offset:offset + key_length] == key:
+                return version, n, self._decoded(buf, version, n, key)
+            slot = (slot + 1) & (self.slots - 1)
+        return version, None, None
+
+    def _keep(self, version, records):
+        # cache `records`, [(n, (key, DeviceRecord or server_info))], read
+        # from version `version`, and return {key: DeviceRecord}
+        if version != self._cache_version:
+            self._cache = {}
+            self._cache_version = version
+        server_list = {}
+        for n, (key, server_info) in records:
+            if not isinstance(server_info, DeviceRecord):
+                server_info = DeviceRecord(server_info)
+                self._cache[key] = (n, server_info)
+            server_list[key] = server_info
+        return server_list
+
+    def get(self, key, default=None):
+        key = _bytes(key)
+        version, n, record = self._consistent(
+            lambda buf: self._get(buf, key))
+        if n is None:
+            return default
+        return self._keep(version, [(n, record)])[record[0]]
+
+    def __getitem__(self, key):
+        server_info = self.get(key)
+        if server_info is None:
+            raise KeyError(key)
+        return server_info
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def _items(self, buf):
+        version = _VERSION.unpack_from(buf, _VERSION_OFFSET)[0]
+        count = _HEADER.unpack_from(buf, 0)[7]
+        if count > self.capacity:
+            raise _Torn()
+        return version, [(n, self._decoded(buf, version, n))
+                         for n in range(1, count + 1)]
+
+    def snapshot(self):
+        """Return `(version, {key: server_info})` read consistently."""
+        version, records = self._consistent(self._items)
+        return version, self._keep(version, records)
+
+    def items(self):
+        return list(self.snapshot()[1].items())
+
+    def keys(self):
+        return list(self.snapshot()[1].keys())
+
+    def __len__(self):
+        return self._consistent(lambda buf: _HEADER.unpack_from(buf, 0)[7])
+
+    @property
+    def version(self):
+        return self._consistent(
+            lambda buf: _VERSION.unpack_from(buf, _VERSION_OFFSET)[0])
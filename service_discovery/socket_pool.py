@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+
+from broadcast_socket import BroadcastSocket
+from multicast_socket import MulticastSocket
+
+
+class SocketPool(object):
+    """Keeps discovery sockets open between discover() calls.
+
+    A socket is lent to one caller at a time. Datagrams that arrived after
+    it was released, such as late replies to an earlier probe, are drained
+    when it is handed out again.
+    """
+
+    def __init__(self, max_idle=4):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, key, factory):
+        with self._lock:
+            idle = self._idle.get(key)
+            s = idle.pop() if idle else None
+        if s is None:
+            s = factory()
+            s.pool_key = key
+        else:
+            for data, addr in s.read():
+                pass
+        return s
+
+    def acquire_broadcast(self):
+        return self._acquire(('broadcast',), BroadcastSocket)
+
+    def acquire_multicast(self, interface=None):
+        return self._acquire(('multicast', interface),
+                             lambda: MulticastSocket(interface=interface))
+
+    def release(self, s):
+        with self._lock:
+            idle = self._idle.setdefault(s.pool_key, [])
+            if len(idle) < self.max_idle:
+                idle.append(s)
+                return
+        s.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for sockets in idle.values():
+            for s in sockets:
+                s.close()
+
+
+default_pool = SocketPool()
@@ -2,77 +2,97 @@
 # -*- coding: utf-8 -*-
 
 import socket
-import email
 
-from broadcast_socket import BroadcastSocket
-from multicast_socket import MulticastSocket
+from description import default_fetcher
+from engine import scan
+from headers import find_header
+from protocols import SSDP, search_targets
 
 
-def discover(interface=None, timeout=1.0):
-    ssdp_group = ('239.255.255.250', 1900)
-    msg = ('M-SEARCH * HTTP/1.1\r\n'
-           'MX: 3\r\n'
-           'ST: upnp:rootdevice\r\n'
-           'HOST: %s:%s\r\n'
-           'MAN: "ssdp:discover"\r\n'
-           '\r\n') % ssdp_group
+def search_target(server_info):
+    return find_header(server_info, 'ST')
 
-    sockets = []
 
-    # discover with multicast
-    s = MulticastSocket(interface=interface)
-    s.set_outgoing_interface()
-    s.set_ttl(1)  # multicast will cross router hops if TTL > 1
-    s.settimeout(timeout)
-    s.join_group(ssdp_group[0])
+def iter_discover(interface=None, timeout=1.0, until=None, cache=None,
+                  socket_pool=None, retries=0, quiet=None,
+                  st='upnp:rootdevice', registry=None, duplicates=None,
+                  budget=None, stats=None):
+    """Yield `(USN, server_info)` for each server as soon as it answers.
+
+    `st` is a search target or a list of them, all probed over the same
+    sockets. See `engine.scan` for the other arguments.
+    """
+    results = scan([SSDP(st)], interface, timeout, until, cache, socket_pool,
+                   retries, quiet, registry, duplicates, budget, stats)
     try:
-        s.write(msg, ssdp_group)
-    except socket.error:
-        s.leave_group(ssdp_group[0])
-        s.close()
-    else:
-        sockets.append(s)
-
-    # discover with broadcast
-    broadcast_addresses = ['<broadcast>', '255.255.255.255', '127.0.0.1']
-    if interface is None:
-        pass
-    elif interface.startswith('192.168.'):
-        addr = '.'.join(interface.split('.')[:3] + ['255'])
-        broadcast_addresses.insert(0, addr)
-    elif interface.startswith('10.'):
-        broadcast_addresses.insert(0, '10.255.255.255')
-
-    for addr in broadcast_addresses:
-        s = BroadcastSocket()
-        s.settimeout(timeout)
-        try:
-            s.write(msg, (addr, ssdp_group[1]))
-        except socket.error:
-            s.close()
-        else:
-            sockets.append(s)
+        for protocol, res_id, server_info in results:
+            yield (res_id, server_info)
+    finally:
+        results.close()
 
-    server_list = {}
-    for s in sockets:
-        try:
-            for data, server in s.read():
-                response_status, header = data.split('\r\n', 1)
-                headers = email.message_from_string(header)
-                res_id = headers.get('USN')
-                if res_id is not None and res_id not in server_list:
-                    server_info = dict(headers.items())
-                    server_list[res_id] = server_info
-        except socket.timeout:
-            pass
-        finally:
-            if hasattr(s, 'leave_group'):
-                s.leave_group(ssdp_group[0])
-            s.close()
 
+def discover(interface=None, timeout=1.0, cache=None, retries=0, quiet=None,
+             st='upnp:rootdevice', registry=None, duplicates=None,
+             budget=None, stats=None):
+    server_list = {}
+    targets = missing = search_targets(st)
+    # answer from the cache for the targets it still holds unexpired
+    # servers of, and only probe for the others
+    if cache is not None and len(cache):
+        for usn, server_info in cache.items():
+            if find_header(server_info, 'USN') is None:
+                continue  # a GDM server, in a cache shared with gdmclient
+            if 'ssdp:all' in targets or \
+                    search_target(server_info) in targets:
+                server_list[usn] = server_info
+        if server_list:
+            if set(server_list) & getattr(cache, 'warm', set()):
+                # loaded by a PersistentDeviceCache; check they are still
+                # there while the caller gets on with them
+                cache.revalidate(lambda: list(iter_discover(
+                    interface, timeout, cache=cache, retries=retries,
+                    quiet=quiet, st=targets)), list(server_list))
+            if 'ssdp:all' in targets:
+                return server_list
+            answered = set(search_target(server_info)
+                           for server_info in server_list.values())
+            missing = [target for target in targets
+                       if target not in answered]
+            if not missing:
+                return server_list
+    server_list.update(iter_discover(interface, timeout, cache=cache,
+                                     retries=retries, quiet=quiet,
+                                     st=missing, registry=registry,
+                                     duplicates=duplicates, budget=budget,
+                                     stats=stats))
     return server_list
 
 
+def discover_by_st(st, interface=None, timeout=1.0, retries=0, quiet=None):
+    """Search for every target in `st` at once and return the servers
+    indexed by the ST they answered with: `{st: {USN: server_info}}`.
+    """
+    st = search_targets(st)
+    server_lists = dict((target, {}) for target in st)
+    for usn, server_info in iter_discover(interface, timeout,
+                                          retries=retries, quiet=quiet,
+                                          st=st):
+        target = search_target(server_info)
+        server_lists.setdefault(target, {})[usn] = server_info
+    return server_lists
+
+
+def describe(server_list, fetcher=None):
+    """Fetch the device descriptions of a `discover()` result and return
+    `{USN: description}`. Descriptions are fetched concurrently and cached
+    by `fetcher`, or the module wide `default_fetcher`, so repeated scans
+    only download the ones of new or rebooted devices.
+    """
+    if fetcher is None:
+        fetcher = default_fetcher
+    return fetcher.describe(server_list)
+
+
 if __name__ == '__main__':
     import sys
     interface = socket.gethostbyname(socket.gethostname())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Discovery metrics.
+#
+# Collecting is off unless a DiscoveryStats is passed to a scan or an
+# observer is registered; the sockets and the scan loop then only test one
+# attribute for None per datagram.
+
+import bisect
+
+# functions called with every finished DiscoveryStats
+observers = []
+
+
+def add_observer(callback):
+    observers.append(callback)
+
+
+def remove_observer(callback):
+    observers.remove(callback)
+
+
+class Histogram(object):
+    """Counts of observed values in exponential buckets, from one
+    microsecond up to about 8 seconds when the values are seconds."""
+
+    bounds = [1e-6 * 2 ** i for i in range(24)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the `p`th percentile."""
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+def _label(sock):
+    # multicast sockets are per interface, there is one broadcast socket
+    return getattr(sock, 'interface', None) or 'broadcast'
+
+
+class DiscoveryStats(object):
+    """What happened during one discovery call.
+
+    `sends` and `receive_calls` count syscalls, `datagrams` and the byte
+    counters what they carried. `by_socket` counts datagrams per receiving
+    socket (an interface address, or 'broadcast'), `by_destination` probes
+    per destination and `responses_by_destination` the servers each
+    destination brought. `parse_time` is a `Histogram` of the seconds spent
+    parsing each datagram and `latency` maps each responding address to the
+    seconds between the first probe and its first response, also kept in
+    the `latencies` histogram.
+    """
+
+    def __init__(self):
+        self.sends = 0
+        self.send_errors = 0
+        self.sent_bytes = 0
+        self.receive_calls = 0
+        self.datagrams = 0
+        self.received_bytes = 0
+        self.duplicates = 0
+        self.by_socket = {}
+        self.by_destination = {}
+        self.responses_by_destination = {}
+        self.parse_time = Histogram()
+        self.latency = {}
+        self.latencies = Histogram()
+
+    # socket hooks
+
+    def sent(self, sock, nbytes, addr):
+        self.sends += 1
+        self.sent_bytes += nbytes
+        self.by_destination[addr] = self.by_destination.get(addr, 0) + 1
+
+    def send_failed(self, sock, addr):
+        self.sends += 1
+        self.send_errors += 1
+
+    def receive_call(self, sock):
+        self.receive_calls += 1
+
+    def received(self, sock, nbytes):
+        self.datagrams += 1
+        self.received_bytes += nbytes
+        label = _label(sock)
+        self.by_socket[label] = self.by_socket.get(label, 0) + 1
+
+    # scan hooks
+
+    def parsed(self, seconds):
+        self.parse_time.observe(seconds)
+
+    def response(self, address, elapsed, destination):
+        if address not in self.latency:
+            self.latency[address] = elapsed
+            self.latencies.observe(elapsed)
+        self.responses_by_destination[destination] = \
+            self.responses_by_destination.get(destination, 0) + 1
+
+    def publish(self):
+        for callback in list(observers):
+            callback(self)
+
+    def __repr__(self):
+        return ('<DiscoveryStats sends=%d datagrams=%d duplicates=%d '
+                'responders=%d>' % (self.sends, self.datagrams,
+                                    self.duplicates, len(self.latency)))
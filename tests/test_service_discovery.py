@@ -8,9 +8,54 @@ test_service_discovery
 Tests for `service_discovery` module.
 """
 
+import os
+import re
+import select
+import shutil
+import socket
+import tempfile
+import threading
+import time
 import unittest
 
-import service_discovery
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:  # Python 3
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from service_discovery import buffer_pool
+from service_discovery.buffer_pool import BufferPool
+from service_discovery.cache import DeviceCache, PersistentDeviceCache
+from service_discovery.dedup import DatagramFilter
+from service_discovery.description import (DescriptionFetcher,
+                                           parse_description)
+from service_discovery.headers import Headers
+from service_discovery.interfaces import (IFF_BROADCAST, IFF_MULTICAST, IFF_UP,
+                                          Interface, InterfaceTable,
+                                          broadcast_address)
+from service_discovery.protocols import GDM, SSDP
+from service_discovery.receiver import ReadBudget, _read_fairly, receive
+from service_discovery.record import DeviceRecord
+from service_discovery.registry import DeviceRegistry
+from service_discovery.scheduler import ProbeScheduler
+from service_discovery.shared_table import SharedDeviceTable
+from service_discovery.stats import DiscoveryStats, Histogram
+
+if str is bytes:
+    # the socket modules, and everything built on them, are Python 2 only
+    from service_discovery import daemon, engine, gdmclient, ssdpclient
+    from service_discovery.notify_listener import NotifyListener
+    from service_discovery.responder import Responder
+    from service_discovery.socket_pool import SocketPool
+
+python2_only = unittest.skipUnless(str is bytes, 'the clients need Python 2')
+
+try:
+    import asyncio
+except ImportError:  # Python 2
+    asyncio = None
+else:
+    from service_discovery import aio
 
 
 class TestServiceDiscovery(unittest.TestCase):
@@ -24,5 +69,1140 @@ class TestServiceDiscovery(unittest.TestCase):
     def tearDown(self):
         pass
 
+
+class TestDatagramFilter(unittest.TestCase):
+
+    def test_seen(self):
+        duplicates = DatagramFilter(size=2)
+        data = bytearray(b'HTTP/1.1 200 OK\r\nUSN: uuid:a\r\n\r\n')
+        a = ('10.0.0.1', 1900)
+        self.assertFalse(duplicates.seen(memoryview(data), a))
+        self.assertTrue(duplicates.seen(bytes(data), a))
+        self.assertFalse(duplicates.seen(data, ('10.0.0.2', 1900)))
+        self.assertFalse(duplicates.seen(b'other', a))
+        # the least recently seen datagram was forgotten
+        self.assertFalse(duplicates.seen(data, a))
+        self.assertEqual((duplicates.hits, duplicates.misses), (1, 4))
+
+
+class TestHeaders(unittest.TestCase):
+
+    response = (b'HTTP/1.1 200 OK\r\n'
+                b'CACHE-CONTROL: max-age=1800\r\n'
+                b'EXT:\r\n'
+                b'ST:upnp:rootdevice\r\n'
+                b'USN: uuid:1::upnp:rootdevice \r\n'
+                b'\r\n'
+                b'Trailer: ignored\r\n')
+
+    def test_get_is_case_insensitive(self):
+        headers = Headers(self.response)
+        self.assertEqual(headers.get('usn'), 'uuid:1::upnp:rootdevice')
+        self.assertEqual(headers.get('St'), 'upnp:rootdevice')
+        self.assertEqual(headers.get('EXT'), '')
+        self.assertEqual(headers.get('Resource-Identifier'), None)
+
+    def test_items(self):
+        headers = Headers(memoryview(bytearray(self.response)))
+        self.assertEqual(headers.status, 'HTTP/1.1 200 OK')
+        self.assertEqual(headers.items(), [
+            ('CACHE-CONTROL', 'max-age=1800'),
+            ('EXT', ''),
+            ('ST', 'upnp:rootdevice'),
+            ('USN', 'uuid:1::upnp:rootdevice'),
+        ])
+        self.assertEqual(headers.get('cache-control'), 'max-age=1800')
+
+    def test_status_line_only(self):
+        headers = Headers(b'HTTP/1.0 200 OK')
+        self.assertEqual(headers.status, 'HTTP/1.0 200 OK')
+        self.assertEqual(headers.items(), [])
+        self.assertEqual(headers.get('USN'), None)
+
+
+class TestDeviceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.cache = DeviceCache(default_max_age=60, clock=lambda: self.now)
+
+    def test_expires_by_max_age(self):
+        self.cache.add('a', {'CACHE-CONTROL': 'max-age=10'})
+        self.cache.add('b', {'Cache-Control': 'no-cache, max-age = 30'})
+        self.cache.add('c', {'Name': 'gdm'})
+        self.assertEqual(len(self.cache), 3)
+
+        self.now += 10
+        self.assertFalse('a' in self.cache)
+        self.assertEqual(sorted(k for k, v in self.cache.items()), ['b', 'c'])
+
+        self.now += 20
+        self.assertEqual(sorted(k for k, v in self.cache.items()), ['c'])
+
+        self.now += 30
+        self.assertEqual(len(self.cache), 0)
+
+    def test_readd_extends_expiry(self):
+        self.cache.add('a', {'CACHE-CONTROL': 'max-age=10'})
+        self.now += 5
+        self.cache.add('a', {'CACHE-CONTROL': 'max-age=10'})
+        self.now += 6
+        self.assertTrue('a' in self.cache)
+        self.assertEqual(len(self.cache), 1)
+        self.now += 5
+        self.assertEqual(len(self.cache), 0)
+
+    def test_max_age_zero_is_not_cached(self):
+        self.cache.add('a', {'CACHE-CONTROL': 'max-age=10'})
+        self.cache.add('a', {'CACHE-CONTROL': 'max-age=0'})
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestPersistentDeviceCache(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'devices.log')
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.directory)
+
+    def open(self):
+        cache = PersistentDeviceCache(self.path, default_max_age=60,
+                                      clock=lambda: self.now)
+        self.caches.append(cache)
+        return cache
+
+    def test_reload(self):
+        cache = self.open()
+        cache.add('a', {'CACHE-CONTROL': 'max-age=10'})
+        cache.add('b', {'Name': 'gdm'})
+        cache.add('c', {'Name': 'gdm'})
+        cache.remove('c')
+        cache.close()
+        with open(self.path, 'ab') as f:
+            f.write(b'["+", "d", 10')  # cut short by a crash
+
+        self.now += 5
+        cache = self.open()
+        self.assertEqual(sorted(cache.items()),
+                         [('a', {'CACHE-CONTROL': 'max-age=10'}),
+                          ('b', {'Name': 'gdm'})])
+        self.assertEqual(cache.warm, set(['a', 'b']))
+        self.assertEqual(cache.expires('a'), 1010.0)
+        cache.close()
+
+        self.now += 5
+        self.assertEqual(self.open().items(), [('b', {'Name': 'gdm'})])
+
+    def test_log_is_compacted(self):
+        cache = self.open()
+        for i in range(200):
+            cache.add('a', {'Name': str(i)})
+        with open(self.path, 'rb') as f:
+            self.assertTrue(len(f.readlines()) <= 66)
+        self.assertEqual(self.open().get('a'), {'Name': '199'})
+
+    def test_revalidate(self):
+        cache = self.open()
+        for key in 'abc':
+            cache.add(key, {'Name': key})
+        cache.close()
+        cache = self.open()
+        cache.revalidate(lambda: cache.add('a', {'Name': 'a'}),
+                         ['a', 'b']).join()
+        self.assertEqual(sorted(k for k, v in cache.items()), ['a', 'c'])
+        self.assertEqual(cache.warm, set(['c']))
+
+
+class TestInterfaceTable(unittest.TestCase):
+
+    flags = IFF_UP | IFF_BROADCAST | IFF_MULTICAST
+
+    def setUp(self):
+        self.now = 0.0
+        self.interfaces = [
+            Interface('eth0', '172.20.3.4', '255.240.0.0', self.flags),
+            Interface('eth1', '10.1.2.3', '255.255.252.0', self.flags),
+            Interface('lo', '127.0.0.1', '255.0.0.0', IFF_UP),
+        ]
+        self.table = InterfaceTable(refresh_interval=10,
+                                    source=lambda: list(self.interfaces),
+                                    clock=lambda: self.now)
+
+    def test_broadcast_address(self):
+        self.assertEqual(broadcast_address('192.168.1.7', '255.255.255.0'),
+                         '192.168.1.255')
+        self.assertEqual(broadcast_address('172.20.3.4', '255.240.0.0'),
+                         '172.31.255.255')
+        self.assertEqual(broadcast_address('10.1.2.3', '255.255.252.0'),
+                         '10.1.3.255')
+
+    def test_broadcast_addresses(self):
+        self.assertEqual(
+            self.table.broadcast_addresses(['172.20.3.4', '10.1.2.3']),
+            ['172.31.255.255', '10.1.3.255', '127.0.0.1'])
+        self.assertEqual(self.table.broadcast_addresses([None]),
+                         ['255.255.255.255', '127.0.0.1'])
+        self.assertEqual(self.table.broadcast_addresses(['127.0.0.1']),
+                         ['127.0.0.1'])
+        self.assertEqual(self.table.multicast_addresses(),
+                         ['172.20.3.4', '10.1.2.3'])
+
+    def test_refresh_on_change(self):
+        self.table.interfaces()
+        self.assertEqual(self.table.generation, 1)
+
+        self.interfaces[1] = Interface('eth1', '10.1.2.3', '255.0.0.0',
+                                       self.flags)
+        self.assertEqual(self.table.broadcast_addresses(['10.1.2.3']),
+                         ['10.1.3.255', '127.0.0.1'])
+
+        self.now += 10
+        self.assertEqual(self.table.broadcast_addresses(['10.1.2.3']),
+                         ['10.255.255.255', '127.0.0.1'])
+        self.assertEqual(self.table.generation, 2)
+
+        self.now += 10
+        self.table.interfaces()
+        self.assertEqual(self.table.generation, 2)
+
+    def test_broadcast_destination(self):
+        addresses = ['172.20.3.4', '10.1.2.3']
+        self.assertEqual(
+            self.table.broadcast_destination('10.1.1.9', addresses),
+            '10.1.3.255')
+        self.assertEqual(
+            self.table.broadcast_destination('127.0.0.1', addresses),
+            '127.0.0.1')
+        self.assertEqual(
+            self.table.broadcast_destination('192.168.1.9', addresses), None)
+
+
+class TestProbeScheduler(unittest.TestCase):
+
+    def test_times(self):
+        self.assertEqual(ProbeScheduler(0, 3.0).times(), [0.0])
+        self.assertEqual(ProbeScheduler(2, 3.0, random=lambda: 0.5).times(),
+                         [0.0, 1.5, 2.5])
+        for t in ProbeScheduler(5, 3.0).times():
+            self.assertTrue(0 <= t < 3.0)
+
+
+class UDPSocket(socket.socket):
+
+    def __init__(self):
+        socket.socket.__init__(self, socket.AF_INET, socket.SOCK_DGRAM)
+        self.bind(('127.0.0.1', 0))
+        self.setblocking(0)
+
+    def read(self, limit=None):
+        while limit is None or limit > 0:
+            try:
+                yield self.recvfrom(8192)
+            except socket.error:
+                return
+            if limit is not None:
+                limit -= 1
+
+
+class LoopbackDevices(object):
+    # answers the SSDP and GDM searches sent on the loopback interface for
+    # `count` devices of each, echoing the ST of SSDP searches
+
+    groups = (('239.255.255.250', 1900), ('239.0.0.250', 32414))
+
+    def __init__(self, count=3):
+        self.count = count
+        self.searches = []
+        self.sockets = []
+        for group in self.groups:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if hasattr(socket, 'SO_REUSEPORT'):
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            s.bind(('', group[1]))
+            s.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                         socket.inet_aton(group[0]) +
+                         socket.inet_aton('127.0.0.1'))
+            self.sockets.append(s)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def replies(self, s, data):
+        if s is self.sockets[1]:
+            return ['HTTP/1.0 200 OK\r\nResource-Identifier: gdm-%d\r\n'
+                    'Name: device %d\r\nPort: 32400\r\n\r\n' % (i, i)
+                    for i in range(self.count)]
+        st = re.search(br'^ST: *(.*?)\r$', data, re.M).group(1)
+        st = st.decode('latin-1')
+        return ['HTTP/1.1 200 OK\r\nCACHE-CONTROL: max-age=1800\r\n'
+                'LOCATION: http://127.0.0.1/%d.xml\r\nST: %s\r\n'
+                'USN: uuid:%d::%s\r\n\r\n' % (i, st, i, st)
+                for i in range(self.count)]
+
+    def run(self):
+        while not self._stopped.is_set():
+            readable, _, _ = select.select(self.sockets, [], [], 0.05)
+            for s in readable:
+                data, addr = s.recvfrom(8192)
+                if not data.startswith(b'M-SEARCH'):
+                    continue
+                self.searches.append(data)
+                for reply in self.replies(s, data):
+                    s.sendto(reply.encode('latin-1'), addr)
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        for s in self.sockets:
+            s.close()
+
+
+class TestRecvBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.receiver = UDPSocket()
+        self.senders = [UDPSocket(), UDPSocket()]
+        self.sent = []
+        for i in range(40):
+            sender = self.senders[i % 2]
+            data = ('datagram %d' % i).encode('ascii') * (i + 1)
+            sender.sendto(data, self.receiver.getsockname())
+            self.sent.append((data, sender.getsockname()))
+        select.select([self.receiver], [], [], 1)
+
+    def tearDown(self):
+        for s in [self.receiver] + self.senders:
+            s.close()
+
+    def read(self, recv_batch, limit=None):
+        received = []
+        try:
+            for view, addr in recv_batch(self.receiver, BufferPool(8, 1024),
+                                         limit, None):
+                received.append((bytes(bytearray(view)), addr))
+        except socket.error:
+            pass  # EAGAIN once drained
+        return received
+
+    def check(self, recv_batch):
+        self.assertEqual(self.read(recv_batch, 10), self.sent[:10])
+        self.assertEqual(self.read(recv_batch, 0), [])
+        self.assertEqual(self.read(recv_batch), self.sent[10:])
+        self.assertEqual(self.read(recv_batch), [])
+
+    @unittest.skipIf(buffer_pool._recvmmsg is None, 'needs recvmmsg')
+    def test_recvmmsg(self):
+        self.check(buffer_pool._recv_batch_mmsg)
+
+    def test_recvfrom_into(self):
+        self.check(buffer_pool._recv_batch_into)
+
+
+class TestProtocols(unittest.TestCase):
+
+    def test_ssdp_probes(self):
+        probes = SSDP(st=['upnp:rootdevice', 'ssdp:all'], mx=2).probes()
+        self.assertEqual(len(probes), 2)
+        for probe, st in zip(probes, ['upnp:rootdevice', 'ssdp:all']):
+            headers = Headers(probe)
+            self.assertEqual(headers.status, 'M-SEARCH * HTTP/1.1')
+            self.assertEqual(headers.get('ST'), st)
+            self.assertEqual(headers.get('MX'), '2')
+            self.assertEqual(headers.get('MAN'), '"ssdp:discover"')
+            self.assertEqual(headers.get('HOST'), '239.255.255.250:1900')
+        self.assertEqual(SSDP('upnp:rootdevice', mx=2).probes(), probes[:1])
+
+
+class TestReceive(unittest.TestCase):
+
+    def setUp(self):
+        self.flooded = UDPSocket()
+        self.quiet = UDPSocket()
+        self.sender = UDPSocket()
+
+    def tearDown(self):
+        for s in (self.flooded, self.quiet, self.sender):
+            s.close()
+
+    def test_budget_is_shared_fairly(self):
+        for i in range(100):
+            self.sender.sendto(b'flood', self.flooded.getsockname())
+        for i in range(3):
+            self.sender.sendto(b'quiet', self.quiet.getsockname())
+        budget = ReadBudget(max_packets=20)
+        budget.turn = 5
+        received = [s for s, data, addr in
+                    receive([self.flooded, self.quiet], 0.2, budget=budget)]
+        self.assertEqual(len(received), 103)
+        # the quiet socket is not starved by the flooded one
+        self.assertEqual(received[:20].count(self.quiet), 3)
+        self.assertTrue(budget.deferred >= 4)
+        self.assertEqual(budget.behind, [])
+
+    def test_byte_budget(self):
+        for i in range(50):
+            self.sender.sendto(b'x' * 100, self.flooded.getsockname())
+        self.sender.sendto(b'quiet', self.quiet.getsockname())
+        select.select([self.flooded], [], [], 1)
+        budget = ReadBudget(max_bytes=1050)
+        received = list(_read_fairly([self.flooded, self.quiet], budget,
+                                     None))
+        # stops at the datagram that spent the budget, and the flooded
+        # socket only gets its share of the first round
+        self.assertEqual(sum(len(data) for s, data, addr in received), 1105)
+        self.assertEqual(received[6][1], b'quiet')
+        self.assertEqual(budget.behind, [self.flooded])
+
+
+class TestDeviceRecord(unittest.TestCase):
+
+    def test_mapping(self):
+        server_info = {'USN': 'uuid:aaa-1::upnp:rootdevice',
+                       'Location': 'http://10.1.2.3/desc.xml',
+                       'BOOTID.UPNP.ORG': '1'}
+        record = DeviceRecord(server_info)
+        self.assertEqual(record, server_info)
+        self.assertEqual(record['LOCATION'], 'http://10.1.2.3/desc.xml')
+        self.assertEqual(record.location, 'http://10.1.2.3/desc.xml')
+        self.assertEqual(record.get('bootid.upnp.org'), '1')
+        self.assertTrue('usn' in record)
+        self.assertFalse('ST' in record)
+        self.assertEqual(len(record), 3)
+        self.assertRaises(AttributeError, setattr, record, 'usn', 'x')
+
+    def test_shares_repeated_values(self):
+        a = DeviceRecord({'ST': ''.join(['upnp:', 'rootdevice'])})
+        b = DeviceRecord({'ST': ''.join(['upnp:', 'rootdevice'])})
+        self.assertTrue(a.st is b.st)
+
+
+class TestDeviceRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = DeviceRegistry()
+        self.registry.add(
+            'uuid:aaa-1::urn:schemas-upnp-org:device:MediaServer:1',
+            {'ST': 'urn:schemas-upnp-org:device:MediaServer:1',
+             'SERVER': 'Linux UPnP/1.0 minidlna/1.1'}, '10.1.2.3')
+        self.registry.add(
+            'uuid:aaa-2::urn:schemas-upnp-org:device:MediaServer:1',
+            {'NT': 'urn:schemas-upnp-org:device:MediaServer:1',
+             'Server': 'Windows UPnP/1.0'}, '10.1.3.3')
+        self.registry.add(
+            'uuid:bbb-1::upnp:rootdevice',
+            {'ST': 'upnp:rootdevice',
+             'SERVER': 'Linux UPnP/1.0 minidlna/1.1'}, '10.1.2.200')
+        self.registry.add('plex-1', {'Name': 'plex', 'Address': '10.1.2.9'})
+
+    def keys(self, result):
+        return sorted(result)
+
+    def test_lookups(self):
+        media_servers = self.registry.by_type(
+            'urn:schemas-upnp-org:device:MediaServer:1')
+        self.assertEqual(len(media_servers), 2)
+        self.assertEqual(self.keys(self.registry.by_server(
+            'Linux UPnP/1.0 minidlna/1.1')), [
+                'uuid:aaa-1::urn:schemas-upnp-org:device:MediaServer:1',
+                'uuid:bbb-1::upnp:rootdevice'])
+        self.assertEqual(len(self.registry.by_uuid_prefix('uuid:aaa')), 2)
+        self.assertEqual(self.keys(self.registry.by_subnet('10.1.2.0/24')), [
+            'plex-1',
+            'uuid:aaa-1::urn:schemas-upnp-org:device:MediaServer:1',
+            'uuid:bbb-1::upnp:rootdevice'])
+
+    def test_query_intersects(self):
+        self.assertEqual(self.keys(self.registry.query(
+            type='urn:schemas-upnp-org:device:MediaServer:1',
+            subnet='10.1.2.0/24')),
+            ['uuid:aaa-1::urn:schemas-upnp-org:device:MediaServer:1'])
+        self.assertEqual(len(self.registry.query()), 4)
+
+    def test_update_and_remove(self):
+        self.registry.add('plex-1', {'Name': 'plex', 'Address': '10.9.0.1'})
+        self.assertEqual(self.keys(self.registry.by_subnet('10.9.0.0/16')),
+                         ['plex-1'])
+        self.assertFalse('plex-1' in self.registry.by_subnet('10.1.2.0/24'))
+
+        self.registry.remove('uuid:bbb-1::upnp:rootdevice')
+        self.assertEqual(self.registry.by_type('upnp:rootdevice'), {})
+        self.assertEqual(len(self.registry), 3)
+
+
+class TestParseDescription(unittest.TestCase):
+
+    def test_parse_description(self):
+        document = (b'<?xml version="1.0"?>'
+                    b'<root xmlns="urn:schemas-upnp-org:device-1-0">'
+                    b'<device><friendlyName>Media</friendlyName>'
+                    b'<iconList><icon><url>/icon.png</url></icon></iconList>'
+                    b'<serviceList><service>'
+                    b'<serviceType>urn:schemas-upnp-org:service:'
+                    b'ContentDirectory:1</serviceType>'
+                    b'<controlURL>/cd</controlURL>'
+                    b'</service></serviceList>'
+                    b'<deviceList><device><friendlyName>Embedded'
+                    b'</friendlyName></device></deviceList>'
+                    b'</device></root>')
+        self.assertEqual(parse_description(document), {
+            'friendlyName': 'Media',
+            'serviceList': [{
+                'serviceType':
+                    'urn:schemas-upnp-org:service:ContentDirectory:1',
+                'controlURL': '/cd'}]})
+        self.assertEqual(parse_description(document, ['friendlyName']),
+                         {'friendlyName': 'Media'})
+
+
+DESCRIPTION = (b'<?xml version="1.0"?>'
+               b'<root xmlns="urn:schemas-upnp-org:device-1-0">'
+               b'<device><friendlyName>Media %s</friendlyName>'
+               b'<modelName>MediaServer</modelName></device></root>')
+
+
+class DescriptionHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        body = DESCRIPTION % self.path[1:].encode('ascii')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDescriptionFetcher(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), DescriptionHandler)
+        self.server.requests = self.server.connections = 0
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.fetcher = DescriptionFetcher(workers=1)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def servers(self, bootid='1'):
+        base = 'http://127.0.0.1:%d/' % self.server.server_address[1]
+        return {
+            'uuid:a::upnp:rootdevice': {'LOCATION': base + 'a',
+                                        'BOOTID.UPNP.ORG': bootid},
+            'uuid:a::urn:schemas-upnp-org:device:MediaServer:1': {
+                'LOCATION': base + 'a', 'BOOTID.UPNP.ORG': bootid},
+            'uuid:b::upnp:rootdevice': {'LOCATION': base + 'b'},
+        }
+
+    def test_describe(self):
+        descriptions = self.fetcher.describe(self.servers())
+        self.assertEqual(len(descriptions), 3)
+        self.assertEqual(descriptions['uuid:b::upnp:rootdevice'],
+                         {'friendlyName': 'Media b',
+                          'modelName': 'MediaServer'})
+        # one request per LOCATION, over one keep-alive connection
+        self.assertEqual(self.server.requests, 2)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_cached_by_bootid(self):
+        self.fetcher.describe(self.servers())
+        self.fetcher.describe(self.servers())
+        self.assertEqual(self.server.requests, 2)
+        self.fetcher.describe(self.servers(bootid='2'))
+        self.assertEqual(self.server.requests, 3)
+
+    def test_stale_connections(self):
+        netloc = '127.0.0.1:%d' % self.server.server_address[1]
+        stale = []
+        for i in range(2):
+            conn = self.fetcher._connections.acquire('http', netloc)[0]
+            conn.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            conn.sock.close()
+            stale.append(conn)
+        self.fetcher._connections._idle[('http', netloc)] = stale
+        descriptions = self.fetcher.describe(self.servers())
+        self.assertEqual(len(descriptions), 3)
+        self.assertFalse(None in descriptions.values())
+
+
+class TestDiscoveryStats(unittest.TestCase):
+
+    def test_histogram(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(50), None)
+        for value in (0.001, 0.002, 0.003, 0.5):
+            histogram.observe(value)
+        self.assertEqual(histogram.count, 4)
+        self.assertEqual(histogram.max, 0.5)
+        self.assertTrue(0.002 <= histogram.percentile(50) < 0.004)
+        self.assertEqual(histogram.percentile(100), 0.5)
+
+    def test_counters(self):
+        stats = DiscoveryStats()
+        stats.received(object(), 100)
+        stats.response('10.1.2.3', 0.2, '10.1.3.255')
+        stats.response('10.1.2.3', 0.4, '239.255.255.250')
+        self.assertEqual(stats.by_socket, {'broadcast': 1})
+        self.assertEqual(stats.latency, {'10.1.2.3': 0.2})
+        self.assertEqual(stats.responses_by_destination,
+                         {'10.1.3.255': 1, '239.255.255.250': 1})
+
+
+class TestSharedDeviceTable(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'devices')
+        self.writer = SharedDeviceTable.create(self.path, capacity=4,
+                                               record_size=128)
+        self.reader = SharedDeviceTable.open(self.path)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+        shutil.rmtree(self.directory)
+
+    def test_publish(self):
+        self.assertEqual((self.reader.version, len(self.reader)), (0, 0))
+        self.writer.publish([
+            ('uuid:a::upnp:rootdevice', {'LOCATION': 'http://10.0.0.1/'}),
+            ('uuid:b::upnp:rootdevice', {'LOCATION': 'http://10.0.0.2/'}),
+            ('uuid:c::upnp:rootdevice', {'SERVER': 'x' * 128}),
+        ])
+        self.assertEqual(self.writer.dropped, 1)
+        self.assertEqual(self.reader.version, 1)
+        self.assertEqual(self.reader['uuid:b::upnp:rootdevice'],
+                         {'LOCATION': 'http://10.0.0.2/'})
+        self.assertFalse('uuid:c::upnp:rootdevice' in self.reader)
+
+        self.writer.publish([
+            ('uuid:b::upnp:rootdevice', {'LOCATION': 'http://10.0.0.3/'})])
+        self.assertEqual(self.reader.snapshot(), (2, {
+            'uuid:b::upnp:rootdevice': {'LOCATION': 'http://10.0.0.3/'}}))
+
+    def test_create_again(self):
+        self.writer.publish([('a', {'Name': 'old'})])
+        self.assertEqual(self.reader['a'], {'Name': 'old'})
+        self.writer.close()
+        # a restarted writer, with another layout
+        self.writer = SharedDeviceTable.create(self.path, capacity=64,
+                                               record_size=256)
+        self.writer.publish([('b', {'Name': 'x' * 200})])
+        self.assertEqual(self.reader.items(), [('b', {'Name': 'x' * 200})])
+        self.assertEqual(self.reader.capacity, 64)
+        # versions carry on from the replaced table's
+        self.assertEqual(self.reader.version, 3)
+        self.assertEqual(os.listdir(self.directory), ['devices'])
+
+    def test_reads_stay_on_current_table(self):
+        self.writer.publish([('a', {'Name': 'old'})])
+        stat = os.stat
+        os.stat = None
+        try:
+            # only a superseded table makes readers look for another file
+            self.assertEqual(self.reader['a'], {'Name': 'old'})
+        finally:
+            os.stat = stat
+
+    def test_records_decoded_once_per_version(self):
+        self.writer.publish([('a', {'Name': 'a'}), ('b', {'Name': 'b'})])
+        record = self.reader['a']
+        self.assertTrue(isinstance(record, DeviceRecord))
+        self.assertTrue(self.reader['a'] is record)
+        self.assertTrue(self.reader.snapshot()[1]['a'] is record)
+        self.writer.publish([('a', {'Name': 'a'})])
+        self.assertFalse(self.reader['a'] is record)
+        self.assertEqual(self.reader['a'], record)
+
+
+@python2_only
+class TestNotifyListener(unittest.TestCase):
+
+    alive = (b'NOTIFY * HTTP/1.1\r\n'
+             b'HOST: 239.255.255.250:1900\r\n'
+             b'CACHE-CONTROL: max-age=100\r\n'
+             b'LOCATION: http://10.0.0.1/a.xml\r\n'
+             b'NT: upnp:rootdevice\r\n'
+             b'NTS: ssdp:alive\r\n'
+             b'SERVER: Linux UPnP/1.1 test/1.0\r\n'
+             b'USN: uuid:a::upnp:rootdevice\r\n'
+             b'BOOTID.UPNP.ORG: 1\r\n\r\n')
+    update = (b'NOTIFY * HTTP/1.1\r\n'
+              b'HOST: 239.255.255.250:1900\r\n'
+              b'LOCATION: http://10.0.0.1/b.xml\r\n'
+              b'NT: upnp:rootdevice\r\n'
+              b'NTS: ssdp:update\r\n'
+              b'USN: uuid:a::upnp:rootdevice\r\n'
+              b'BOOTID.UPNP.ORG: 1\r\n'
+              b'NEXTBOOTID.UPNP.ORG: 2\r\n\r\n')
+    byebye = (b'NOTIFY * HTTP/1.1\r\n'
+              b'HOST: 239.255.255.250:1900\r\n'
+              b'NT: upnp:rootdevice\r\n'
+              b'NTS: ssdp:byebye\r\n'
+              b'USN: uuid:a::upnp:rootdevice\r\n\r\n')
+    usn = 'uuid:a::upnp:rootdevice'
+    addr = ('10.0.0.1', 1900)
+
+    def setUp(self):
+        self.now = 1000.0
+        self.registry = DeviceRegistry()
+        self.listener = NotifyListener(
+            cache=DeviceCache(clock=lambda: self.now),
+            registry=self.registry)
+        self.events = []
+        for event in self.listener.events:
+            self.listener.subscribe(event, self.recorder(event))
+
+    def recorder(self, event):
+        def callback(usn, server_info):
+            self.events.append((event, usn, server_info.get('LOCATION')))
+        return callback
+
+    def test_alive_update_byebye(self):
+        self.listener.handle(self.alive, self.addr)
+        self.listener.handle(self.alive, self.addr)
+        self.assertEqual(self.events, [
+            ('add', self.usn, 'http://10.0.0.1/a.xml')])
+        self.assertTrue(self.usn in self.registry)
+
+        self.now += 50
+        self.listener.handle(self.update, self.addr)
+        self.assertEqual(self.events[-1],
+                         ('change', self.usn, 'http://10.0.0.1/b.xml'))
+        server_info = self.listener.devices()[self.usn]
+        self.assertEqual(server_info['SERVER'], 'Linux UPnP/1.1 test/1.0')
+        self.assertEqual(server_info['BOOTID.UPNP.ORG'], '2')
+        self.assertFalse('NEXTBOOTID.UPNP.ORG' in server_info)
+        self.assertEqual(
+            self.registry.get(self.usn)['LOCATION'], 'http://10.0.0.1/b.xml')
+        # the update did not extend the announced max-age
+        self.assertEqual(self.listener.cache.expires(self.usn), 1100.0)
+
+        self.listener.handle(self.byebye, self.addr)
+        self.assertEqual(self.events[-1],
+                         ('remove', self.usn, 'http://10.0.0.1/b.xml'))
+        self.assertEqual(self.listener.devices(), {})
+        self.assertFalse(self.usn in self.registry)
+
+    def test_ignored(self):
+        # an update or byebye of an unknown device, and a search
+        self.listener.handle(self.update, self.addr)
+        self.listener.handle(self.byebye, self.addr)
+        self.listener.handle(b'M-SEARCH * HTTP/1.1\r\n'
+                             b'MAN: "ssdp:discover"\r\n'
+                             b'ST: ssdp:all\r\n\r\n', self.addr)
+        self.assertEqual(self.events, [])
+        self.assertEqual(self.listener.devices(), {})
+        self.assertEqual(len(self.registry), 0)
+
+    def test_expire(self):
+        self.listener.handle(self.alive, self.addr)
+        self.now += 100
+        self.listener.expire()
+        self.assertEqual(self.events[-1],
+                         ('remove', self.usn, 'http://10.0.0.1/a.xml'))
+        self.assertFalse(self.usn in self.registry)
+
+
+class SentMessages(object):
+    # stands in for a responder socket
+
+    def __init__(self):
+        self.messages = []
+
+    def write(self, data, addr):
+        self.messages.append((data, addr))
+
+
+@python2_only
+class TestResponder(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.responder = Responder(rate=2, clock=lambda: self.now)
+        self.responder.add_ssdp(
+            '1234', 'urn:schemas-upnp-org:device:MediaServer:1',
+            'http://10.0.0.1/a.xml', 'Linux UPnP/1.1 test/1.0',
+            services=['urn:schemas-upnp-org:service:ContentDirectory:1'],
+            bootid=7)
+        self.responder.ssdp_socket = SentMessages()
+        self.responder.gdm_socket = SentMessages()
+
+    def search(self, st, man='"ssdp:discover"', host='10.0.0.2'):
+        self.responder.ssdp_socket.messages = []
+        data = 'M-SEARCH * HTTP/1.1\r\nHOST: 239.255.255.250:1900\r\n'
+        if man is not None:
+            data += 'MAN: %s\r\n' % man
+        data += 'MX: 1\r\nST: %s\r\n\r\n' % st
+        self.responder.handle_ssdp(data.encode('latin-1'), (host, 50000))
+        return [Headers(message).get('USN')
+                for message, addr in self.responder.ssdp_socket.messages]
+
+    def test_search_target(self):
+        self.assertEqual(self.search('upnp:rootdevice'),
+                         ['uuid:1234::upnp:rootdevice'])
+        self.assertEqual(self.search('uuid:1234', host='10.0.0.3'),
+                         ['uuid:1234'])
+        self.assertEqual(len(self.search('ssdp:all', host='10.0.0.4')), 4)
+        self.assertEqual(self.search('urn:other', host='10.0.0.5'), [])
+
+    def test_man_is_required(self):
+        self.assertEqual(self.search('upnp:rootdevice', man=None), [])
+        self.assertEqual(self.search('upnp:rootdevice', man='"other"'), [])
+
+    def test_gdm(self):
+        search = b'M-SEARCH * HTTP/1.1\r\n\r\n'
+        self.responder.handle_gdm(search, ('10.0.0.2', 50000))
+        self.assertEqual(self.responder.gdm_socket.messages, [])
+        self.responder.add_gdm('abcd', 'test', 32400,
+                               {'Content-Type': 'plex/media-server'})
+        self.responder.handle_gdm(search, ('10.0.0.2', 50000))
+        [(message, addr)] = self.responder.gdm_socket.messages
+        self.assertEqual(Headers(message).get('Resource-Identifier'), 'abcd')
+        self.assertEqual(addr, ('10.0.0.2', 50000))
+
+    def test_rate(self):
+        self.assertTrue(self.search('upnp:rootdevice'))
+        self.assertTrue(self.search('upnp:rootdevice'))
+        self.assertFalse(self.search('upnp:rootdevice'))
+        self.assertTrue(self.search('upnp:rootdevice', host='10.0.0.3'))
+        self.now += 0.5
+        self.assertTrue(self.search('upnp:rootdevice'))
+        self.assertFalse(self.search('upnp:rootdevice'))
+
+    def test_notify_interval(self):
+        self.assertEqual(self.responder.notify_interval, 1800 / 3.0)
+        self.responder.add_ssdp('5678', 'urn:other', 'http://10.0.0.1/',
+                                'test', max_age=4)
+        self.assertEqual(self.responder.notify_interval, 4 / 3.0)
+        self.responder.add_ssdp('9abc', 'urn:other', 'http://10.0.0.1/',
+                                'test', max_age=1)
+        self.assertEqual(self.responder.notify_interval, 1.0)
+
+    def test_forget_least_recent_requester(self):
+        self.responder.max_requesters = 2
+        self.responder._allow('10.0.0.2')
+        self.responder._allow('10.0.0.2')
+        self.responder._allow('10.0.0.3')
+        self.responder._allow('10.0.0.4')
+        self.assertEqual(list(self.responder._requesters),
+                         ['10.0.0.3', '10.0.0.4'])
+        self.now += 0.1
+        self.responder._allow('10.0.0.3')
+        self.responder._allow('10.0.0.5')
+        # a host cycling addresses does not reset the others
+        self.assertEqual(list(self.responder._requesters),
+                         ['10.0.0.3', '10.0.0.5'])
+        self.assertFalse(self.responder._allow('10.0.0.3'))
+
+    def test_notify(self):
+        self.responder.notify()
+        alive = [Headers(message)
+                 for message, addr in self.responder.ssdp_socket.messages]
+        self.assertEqual([h.get('NT') for h in alive], [
+            'upnp:rootdevice', 'uuid:1234',
+            'urn:schemas-upnp-org:device:MediaServer:1',
+            'urn:schemas-upnp-org:service:ContentDirectory:1'])
+        for h in alive:
+            self.assertEqual(h.status, 'NOTIFY * HTTP/1.1')
+            self.assertEqual(h.get('NTS'), 'ssdp:alive')
+            self.assertEqual(h.get('LOCATION'), 'http://10.0.0.1/a.xml')
+            self.assertEqual(h.get('CACHE-CONTROL'), 'max-age=1800')
+            self.assertEqual(h.get('BOOTID.UPNP.ORG'), '7')
+
+        self.responder.ssdp_socket.messages = []
+        self.responder.notify(self.responder._byebye)
+        byebye = [Headers(message)
+                  for message, addr in self.responder.ssdp_socket.messages]
+        self.assertEqual([h.get('USN') for h in byebye], [
+            'uuid:1234::upnp:rootdevice', 'uuid:1234',
+            'uuid:1234::urn:schemas-upnp-org:device:MediaServer:1',
+            'uuid:1234::urn:schemas-upnp-org:service:ContentDirectory:1'])
+        for h in byebye:
+            self.assertEqual(h.get('NTS'), 'ssdp:byebye')
+            self.assertEqual(h.get('LOCATION'), None)
+        self.assertEqual(set(addr for message, addr in
+                             self.responder.ssdp_socket.messages),
+                         set([('239.255.255.250', 1900)]))
+
+
+@python2_only
+class TestDiscoveryDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.found = []
+        self.scan = daemon.scan
+        daemon.scan = lambda *args, **kwargs: list(self.found)
+        self.daemons = []
+
+    def tearDown(self):
+        daemon.scan = self.scan
+        for d in self.daemons:
+            d.stop()
+            if isinstance(d.cache, PersistentDeviceCache):
+                d.cache.close()
+        shutil.rmtree(self.directory)
+
+    def daemon(self, **kwargs):
+        d = daemon.DiscoveryDaemon(listen=False, **kwargs)
+        self.daemons.append(d)
+        return d
+
+    def test_snapshot(self):
+        d = self.daemon()
+        self.found = [(None, 'a', {'LOCATION': 'http://10.0.0.1/'})]
+        d.probe()
+        snapshot = d.snapshot()
+        self.assertEqual(snapshot.version, 1)
+        self.assertRaises(AttributeError, setattr, snapshot, 'version', 5)
+
+        self.found = [(None, 'b', {'LOCATION': 'http://10.0.0.2/'})]
+        d.probe()
+        self.assertEqual((snapshot.version, snapshot.keys()), (1, ['a']))
+        self.assertEqual((d.snapshot().version, sorted(d.snapshot())),
+                         (2, ['a', 'b']))
+
+    def test_fetch_snapshot(self):
+        path = os.path.join(self.directory, 'daemon.sock')
+        d = self.daemon(socket_path=path, tick=0.1)
+        self.found = [(None, 'a', {'LOCATION': 'http://10.0.0.1/',
+                                   'SERVER': 'caf\xe9'})]
+        d.start()
+        self.assertTrue(d.ready.wait(5))
+        snapshot = daemon.fetch_snapshot(path)
+        self.assertEqual(snapshot.version, d.snapshot().version)
+        self.assertEqual(dict(snapshot['a'].items()),
+                         {'LOCATION': 'http://10.0.0.1/',
+                          'SERVER': 'caf\xe9'})
+
+    def test_warm_start(self):
+        path = os.path.join(self.directory, 'devices.log')
+        cache = PersistentDeviceCache(path)
+        cache.add('a', {'LOCATION': 'http://10.0.0.1/'})
+        cache.add('b', {'LOCATION': 'http://10.0.0.2/'})
+        cache.close()
+
+        d = self.daemon(cache_path=path)
+        self.assertTrue(d.ready.is_set())
+        self.assertEqual(sorted(d.snapshot()), ['a', 'b'])
+        self.found = [(None, 'b', {'LOCATION': 'http://10.0.0.2/'})]
+        d.probe()
+        self.assertEqual(d.snapshot().keys(), ['b'])
+        self.assertEqual(d.cache.warm, set())
+
+
+@unittest.skipIf(asyncio is None, 'needs asyncio')
+class TestAsyncDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.devices = LoopbackDevices()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.devices.close()
+
+    def collect(self, servers):
+        results = []
+        while True:
+            try:
+                results.append(self.loop.run_until_complete(
+                    servers.__anext__()))
+            except StopAsyncIteration:
+                return results
+
+    def test_discover(self):
+        server_list = self.loop.run_until_complete(
+            aio.ssdp_discover('127.0.0.1', 0.3))
+        self.assertEqual(sorted(server_list), [
+            'uuid:%d::upnp:rootdevice' % i for i in range(3)])
+        self.assertEqual(server_list['uuid:1::upnp:rootdevice']['LOCATION'],
+                         'http://127.0.0.1/1.xml')
+
+    def test_iter_scan(self):
+        results = self.collect(aio.iter_scan([SSDP(), GDM()], '127.0.0.1',
+                                             0.3))
+        self.assertEqual(sorted(key for protocol, key, server_info
+                                in results),
+                         ['gdm-0', 'gdm-1', 'gdm-2'] +
+                         ['uuid:%d::upnp:rootdevice' % i for i in range(3)])
+        gdm = [server_info for protocol, key, server_info in results
+               if protocol.name == 'gdm']
+        self.assertEqual(gdm[0]['Address'], '127.0.0.1')
+
+    def test_until(self):
+        start = time.time()
+        results = self.collect(aio.gdm_iter_discover(
+            '127.0.0.1', 5.0, until=lambda server_info: True))
+        self.assertEqual(len(results), 1)
+        self.assertTrue(time.time() - start < 1.0)
+
+
+@python2_only
+class TestSocketPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = SocketPool(max_idle=1)
+        self.peer = UDPSocket()
+
+    def tearDown(self):
+        self.pool.close()
+        self.peer.close()
+
+    def test_reuse(self):
+        s = self.pool.acquire_broadcast()
+        s.write(b'probe', self.peer.getsockname())
+        port = s.getsockname()[1]
+        self.pool.release(s)
+        # a late reply, arriving while nobody holds the socket
+        self.peer.sendto(b'late', ('127.0.0.1', port))
+        select.select([s], [], [], 1)
+
+        self.assertTrue(self.pool.acquire_broadcast() is s)
+        self.assertEqual(list(s.read()), [])
+        other = self.pool.acquire_broadcast()
+        self.assertFalse(other is s)
+        self.pool.release(s)
+        self.pool.release(other)  # beyond max_idle, closed
+        self.assertRaises(socket.error, other.fileno)
+        self.assertTrue(self.pool.acquire_broadcast() is s)
+
+    def test_multicast_per_interface(self):
+        s = self.pool.acquire_multicast('127.0.0.1')
+        self.pool.release(s)
+        self.assertFalse(self.pool.acquire_multicast(None) is s)
+        self.assertTrue(self.pool.acquire_multicast('127.0.0.1') is s)
+
+
+@python2_only
+class TestDiscovery(unittest.TestCase):
+
+    def setUp(self):
+        self.devices = LoopbackDevices()
+
+    def tearDown(self):
+        self.devices.close()
+
+    def test_iter_discover_streams(self):
+        start = time.time()
+        arrivals = []
+        for usn, server_info in ssdpclient.iter_discover('127.0.0.1', 0.5):
+            arrivals.append(time.time() - start)
+        self.assertEqual(len(arrivals), 3)
+        # servers arrive as they answer, not when the timeout is over
+        self.assertTrue(arrivals[-1] < 0.25)
+        self.assertTrue(time.time() - start >= 0.5)
+
+    def test_scan_protocols_together(self):
+        start = time.time()
+        found = list(engine.scan([SSDP(), GDM()], '127.0.0.1', 0.5))
+        elapsed = time.time() - start
+        self.assertEqual(sorted((protocol.name, key)
+                                for protocol, key, server_info in found),
+                         [('gdm', 'gdm-%d' % i) for i in range(3)] +
+                         [('ssdp', 'uuid:%d::upnp:rootdevice' % i)
+                          for i in range(3)])
+        # one deadline for both, not one timeout after the other
+        self.assertTrue(0.5 <= elapsed < 0.9)
+        self.assertEqual(set(search.split(b'\r\n')[0]
+                             for search in self.devices.searches),
+                         set([b'M-SEARCH * HTTP/1.0', b'M-SEARCH * HTTP/1.1']))
+
+    def test_unusable_interface(self):
+        # an address no interface has, next to a working one
+        server_list = ssdpclient.discover(['127.0.0.1', '10.254.254.254'],
+                                          0.3)
+        self.assertEqual(len(server_list), 3)
+
+    def test_budget_and_duplicates(self):
+        budget = ReadBudget()
+        duplicates = DatagramFilter()
+        self.assertEqual(len(ssdpclient.discover(
+            '127.0.0.1', 0.2, budget=budget, duplicates=duplicates)), 3)
+        self.assertEqual(len(gdmclient.discover(
+            '127.0.0.1', 0.2, budget=budget, duplicates=duplicates)), 3)
+        self.assertTrue(budget.ticks >= 2)
+        self.assertEqual(duplicates.misses, 6)
+
+    def test_discover_by_st(self):
+        server_lists = ssdpclient.discover_by_st(
+            ['upnp:rootdevice', 'urn:schemas-upnp-org:device:Basic:1'],
+            '127.0.0.1', 0.3)
+        self.assertEqual(sorted(server_lists), [
+            'upnp:rootdevice', 'urn:schemas-upnp-org:device:Basic:1'])
+        for st, server_list in server_lists.items():
+            self.assertEqual(sorted(server_list),
+                             ['uuid:%d::%s' % (i, st) for i in range(3)])
+            for server_info in server_list.values():
+                self.assertEqual(server_info['ST'], st)
+
+    def test_discover_by_one_st(self):
+        server_lists = ssdpclient.discover_by_st('upnp:rootdevice',
+                                                 '127.0.0.1', 0.3)
+        self.assertEqual(list(server_lists), ['upnp:rootdevice'])
+        self.assertEqual(len(server_lists['upnp:rootdevice']), 3)
+
+    def test_cache_answers_only_cached_targets(self):
+        cache = DeviceCache()
+        ssdpclient.discover('127.0.0.1', 0.2, cache=cache)
+        del self.devices.searches[:]
+        basic = 'urn:schemas-upnp-org:device:Basic:1'
+        server_list = ssdpclient.discover(
+            '127.0.0.1', 0.2, cache=cache, st=['upnp:rootdevice', basic])
+        self.assertEqual(len(server_list), 6)
+        # only the target missing from the cache was searched for
+        self.assertTrue(self.devices.searches)
+        for search in self.devices.searches:
+            self.assertEqual(Headers(search).get('ST'), basic)
+
+        del self.devices.searches[:]
+        server_list = ssdpclient.discover(
+            '127.0.0.1', 0.2, cache=cache, st=['upnp:rootdevice', basic])
+        self.assertEqual(len(server_list), 6)
+        self.assertEqual(self.devices.searches, [])
+
+    def test_shared_cache(self):
+        cache = DeviceCache()
+        ssdpclient.discover('127.0.0.1', 0.2, cache=cache)
+        self.assertEqual(sorted(gdmclient.discover('127.0.0.1', 0.2,
+                                                   cache=cache)),
+                         ['gdm-0', 'gdm-1', 'gdm-2'])
+        self.assertEqual(len(cache), 6)
+        self.assertEqual(sorted(gdmclient.discover(cache=cache)),
+                         ['gdm-0', 'gdm-1', 'gdm-2'])
+        self.assertEqual(sorted(ssdpclient.discover(cache=cache,
+                                                    st='ssdp:all')),
+                         ['uuid:%d::upnp:rootdevice' % i for i in range(3)])
+
+    def test_until(self):
+        start = time.time()
+        found = list(gdmclient.iter_discover(
+            '127.0.0.1', 5.0,
+            until=lambda server_info: server_info['Name'] == 'device 1'))
+        self.assertTrue(time.time() - start < 1.0)
+        self.assertEqual(found[-1][1]['Name'], 'device 1')
+
+
 if __name__ == '__main__':
     unittest.main()